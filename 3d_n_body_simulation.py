@@ -1,128 +1,521 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.animation import FuncAnimation
-from matplotlib.widgets import Slider
+from nbody_kernels import TiledKernel, BatchedKernel
+from barnes_hut import BarnesHutSolver
+from nbody_parallel import ParallelSolver
+from particle_mesh import ParticleMeshSolver
+from spatial_hash import SpatialHash
+from ring_buffer import RingBuffer
 
 epsilon = 0.1
 
+# Yoshida's 4th order composition of leapfrog: drift and kick coefficients
+_w1 = 1 / (2 - 2**(1/3))
+_w0 = -2**(1/3) * _w1
+YOSHIDA_C = (_w1 / 2, (_w0 + _w1) / 2, (_w0 + _w1) / 2, _w1 / 2)
+YOSHIDA_D = (_w1, _w0, _w1)
 
-class NbodySystem():
-    def __init__(self, n_bodies, masses, positions, velocities):
-        self.masses = np.array(masses, dtype="float64")
-        self.n = n_bodies
 
-        self.time = 0
+class NbodyBase():
+    """State, integrators and diagnostics shared by NbodySystem and NbodyEnsemble.
+
+    A subclass sets up n, masses, pos, velocities, acc, their initial values
+    init_p and init_v, and time, then calls this __init__ with its force
+    kernel; _pos is the storage that the trail records.
+    """
+    INTEGRATORS = ("euler", "leapfrog", "yoshida4", "rk4")
+
+    def __init__(self, kernel, history=50, integrator="euler", energy_every=10, energy_log=1000):
         self.G = 1.0
         self.base_dt = 0.01
         self.time_scale = 1.0
 
-        self.positions = [np.array(positions, dtype="float64")]
-        self.init_p = np.array(positions, dtype="float64").copy()
-        self.velocities = np.array(velocities, dtype="float64")
-        self.init_v = np.array(velocities, dtype="float64").copy()
+        self.trail = RingBuffer(history, self.pos.shape)
+        self.trail.push(self.pos)
 
+        # Force kernel with its scratch buffers, reused every step
+        self.kernel = kernel
+        self.force_evaluations = 0  # Number of single-body accelerations computed
 
+        # Time integration
+        if integrator not in self.INTEGRATORS:
+            raise ValueError(f"integrator should be one of {self.INTEGRATORS}, {integrator} was given")
+        self.integrator = integrator
+        self.cached_acc = None      # Acceleration at self.pos, kept by the leapfrog between steps
+        self.cached_phi = None      # Potential per body at self.pos, a by-product of the forces
+        self.steps = 0
 
+        # Energy diagnostics, every energy_every steps
+        self.energy_every = energy_every
+        self.e0 = self.get_energy()
+        self.energy = self.get_energy()  # A copy, the potential is cached by now
+        self.energy_log = RingBuffer(energy_log, (2, *np.shape(self.e0)))  # (time, relative energy drift)
 
 
+    @property
+    def G(self):
+        return self._G
 
-    def get_acceleration(self, positions):
-        """Returns the acceleration that all particles feel"""
-        pos = np.array(positions[-1])
-        acc = np.zeros_like(pos)
+    @G.setter
+    def G(self, G):
+        # The cached acceleration is proportional to G
+        self._G = G
+        self.clear_cache()
 
-        for idx in range(self.n):
-            r = pos - pos[idx]  # Shape: (n, 3)
-            r_norm = np.linalg.norm(r, axis=1) + epsilon
-            mask = r_norm != epsilon # Avoid self-interaction
-            r_unit = r / r_norm[:, np.newaxis]**3 # Shape: (n, 3)
 
-            acc[idx] = np.sum(self.G * self.masses[:, np.newaxis] * r_unit * mask[:, np.newaxis], axis=0)
-
-        return acc
+    def clear_cache(self):
+        """Forget the acceleration and potential at the current positions"""
+        self.cached_acc = None
+        self.cached_phi = None
 
 
+    @property
+    def positions(self):
+        """The last `history` positions, oldest first, shape (history, n, 3)"""
+        return self.trail.view()[..., :self.n, :]
 
 
+    def get_energy(self):
+        """Compute total energy (kinetic + potential), per member for an ensemble"""
+        kinnetic = 0.5*np.sum(self.masses * np.sum(self.velocities**2, axis=-1), axis=-1)
 
+        # The potential comes with the forces: free after a leapfrog step,
+        # otherwise it costs one force evaluation, which is then cached
+        if self.cached_phi is None:
+            self.cached_phi = np.empty(self.masses.shape)
+            self.cached_acc = self.get_acceleration(self.pos, potential=self.cached_phi).copy()
 
+        # Pair potential -G m_i m_j (r + eps/2) / (r + eps)^2, whose gradient is the softened force
+        potential = 0.5 * np.sum(self.masses * self.cached_phi, axis=-1)
+        return kinnetic + potential
 
 
-    def get_energy(self):
-        """Compute total energy (kinetic + potential)"""
-        kinnetic = 0.5*np.sum(self.masses * np.sum(self.velocities**2, axis=1))
+    def diagnostic_potential(self):
+        """Buffer for the potential when the coming step ends with an energy record, otherwise None"""
+        if self.energy_every and (self.steps + 1) % self.energy_every == 0:
+            return np.empty(self.masses.shape)
+        return None
 
-        pos = self.positions[-1]
 
-        # Vectorize potential
-        idx = np.triu_indices(self.n, k=1)
-        r = pos[idx[0]] - pos[idx[1]] # Pairwise differences
-        r_norm = np.linalg.norm(r, axis=1) + epsilon
+    def record_energy(self):
+        """Store the energy and append the relative drift since t = 0 to the energy log"""
+        self.energy = self.get_energy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drift = (self.energy - self.e0) / np.abs(self.e0)
+        self.energy_log.push((self.time, drift))
 
-        potential = -self.G * np.sum(self.masses[idx[0]] * self.masses[idx[1]] / r_norm)
-        return kinnetic + potential 
-        
 
+    def update(self):
+        """Update the state of the N bodies"""
+        dt = self.base_dt * self.time_scale
+        self.time += dt
+        self.advance(dt)
+        self.trail.push(self._pos)  # The whole storage, rows past n are never read
+        self.steps += 1
+        if self.energy_every and self.steps % self.energy_every == 0:
+            self.record_energy()
+
+
+    def advance(self, dt):
+        """Move the bodies by one step of the chosen integrator"""
+        if self.integrator == "leapfrog":
+            self.leapfrog_step(dt)
+        elif self.integrator == "yoshida4":
+            self.yoshida_step(dt)
+        elif self.integrator == "rk4":
+            self.rk4_step(dt)
+        else:
+            self.euler_step(dt)
+
+
+    def run(self, steps, record_every=1, path=None):
+        """Advance the system by `steps` steps without any plotting.
+
+        When a path is given, snapshots of the initial state and of every
+        `record_every`-th step are streamed to a memory-mapped .npy file with
+        fields time, energy, positions and velocities, where bodies that were
+        merged away are NaN. It can be read back
+        lazily with np.load(path, mmap_mode="r"). Returns the memory map, or
+        None when nothing is recorded.
+        """
+        if record_every < 1:
+            raise ValueError(f"record_every should be >= 1, {record_every} was given")
+
+        snapshots = None
+        if path is not None:
+            dtype = np.dtype([("time", "f8", np.shape(self.time)), ("energy", "f8", np.shape(self.energy)),
+                              ("positions", "f8", self.init_p.shape), ("velocities", "f8", self.init_p.shape)])
+            snapshots = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(steps // record_every + 1,))
+            snapshots[0] = (self.time, self.get_energy(), self.expand(self.pos), self.expand(self.velocities))
+
+        for step in range(1, steps + 1):
+            self.update()
+            if snapshots is not None and step % record_every == 0:
+                snapshots[step // record_every] = (self.time, self.get_energy(),
+                                                   self.expand(self.pos), self.expand(self.velocities))
+
+        if snapshots is not None:
+            snapshots.flush()
+        return snapshots
+
+
+    def expand(self, values):
+        """Per-body values indexed by original body"""
+        return values
+
+
+    def euler_step(self, dt):
+        """Semi-implicit Euler, 1 force evaluation"""
+        self.clear_cache()
+        self.velocities += self.get_acceleration(self.pos)*dt
+        self.pos += self.velocities * dt
+
+
+    def leapfrog_step(self, dt):
+        """Kick-drift-kick leapfrog (velocity Verlet), 1 force evaluation"""
+        if self.cached_acc is None:
+            self.cached_acc = self.get_acceleration(self.pos).copy()
+        self.velocities += 0.5 * dt * self.cached_acc
+        self.pos += self.velocities * dt
+        self.cached_phi = self.diagnostic_potential()
+        self.cached_acc[...] = self.get_acceleration(self.pos, potential=self.cached_phi)
+        self.velocities += 0.5 * dt * self.cached_acc
+
+
+    def yoshida_step(self, dt):
+        """Yoshida's 4th order symplectic scheme, 3 force evaluations"""
+        self.clear_cache()
+        for c, d in zip(YOSHIDA_C, YOSHIDA_D):
+            self.pos += c * dt * self.velocities
+            self.velocities += d * dt * self.get_acceleration(self.pos)
+        self.pos += YOSHIDA_C[-1] * dt * self.velocities
+
+
+    def rk4_step(self, dt):
+        """Classic 4th order Runge-Kutta, 4 force evaluations"""
+        self.clear_cache()
+        x0, v0 = self.pos.copy(), self.velocities.copy()
+
+        k1x, k1v = v0, self.get_acceleration(x0).copy()
+        k2x = v0 + 0.5 * dt * k1v
+        k2v = self.get_acceleration(x0 + 0.5 * dt * k1x).copy()
+        k3x = v0 + 0.5 * dt * k2v
+        k3v = self.get_acceleration(x0 + 0.5 * dt * k2x).copy()
+        k4x = v0 + dt * k3v
+        k4v = self.get_acceleration(x0 + dt * k3x)
+
+        self.pos += dt / 6 * (k1x + 2*k2x + 2*k3x + k4x)
+        self.velocities += dt / 6 * (k1v + 2*k2v + 2*k3v + k4v)
+
+
+class NbodySystem(NbodyBase):
+    def __init__(self, n_bodies, masses, positions, velocities, solver="direct", theta=0.5, workers=None,
+                 history=50, integrator="euler", adaptive=False, eta=0.2, max_level=6,
+                 energy_every=10, energy_log=1000, encounter_radius=None, merge_radius=None):
+        # Storage for all bodies. masses, pos, velocities, ids and acc are views on
+        # the first n rows, so merging bodies compacts them in place
+        self._masses = np.array(masses, dtype="float64")
+        self._pos = np.array(positions, dtype="float64")
+        self._velocities = np.array(velocities, dtype="float64")
+        self._ids = np.arange(n_bodies)  # Original index of every body
+        self._acc = np.empty((n_bodies, 3))
+        self.use_bodies(n_bodies)
 
+        self.time = 0
+        self.init_m = self._masses.copy()
+        self.init_p = self._pos.copy()
+        self.init_v = self._velocities.copy()
+
+        # A configured solver object, e.g. ParticleMeshSolver(grid=128, box_size=100), can be passed too
+        if not isinstance(solver, str):
+            kernel = solver
+        elif solver == "direct":
+            kernel = TiledKernel()
+        elif solver == "barnes-hut":
+            kernel = BarnesHutSolver(theta)
+        elif solver == "parallel":
+            kernel = ParallelSolver(workers)
+        elif solver == "particle-mesh":
+            kernel = ParticleMeshSolver()
+        else:
+            raise ValueError(f"solver should be 'direct', 'barnes-hut', 'parallel' or 'particle-mesh', {solver} was given")
+
+        if adaptive and integrator != "leapfrog":
+            raise ValueError("adaptive block time steps are only available with the leapfrog integrator")
+        self.adaptive = adaptive
+        self.eta = eta              # Body time step is eta * sqrt(epsilon / |a|)
+        self.max_level = max_level  # At most 2**max_level substeps per step
+
+        # Close encounters and merging collisions, found with a spatial hash
+        self.encounter_radius = encounter_radius
+        self.merge_radius = merge_radius
+        radii = [r for r in (encounter_radius, merge_radius) if r]
+        self.neighbours = SpatialHash(max(radii)) if radii else None
+        self.encounters = np.empty((0, 2), dtype=int)  # Pairs of original ids closer than encounter_radius
+        self.encounter_count = 0
+        self.collision_count = 0     # Bodies that disappeared by merging
+        self.dissipated_energy = 0   # Energy lost in the merges
+
+        super().__init__(kernel, history, integrator, energy_every, energy_log)
+
+
+    def use_bodies(self, n):
+        """Point the per-body arrays at the first n bodies of the storage"""
+        self.n = n
+        self.masses = self._masses[:n]
+        self.pos = self._pos[:n]
+        self.velocities = self._velocities[:n]
+        self.ids = self._ids[:n]
+        self.acc = self._acc[:n]
+
+
+    def get_acceleration(self, pos, targets=None, out=None, potential=None):
+        """Returns the acceleration that the target particles (default all) feel at positions pos.
+        The potential they feel is written into `potential` when it is given."""
+        if out is None and targets is None:
+            if self.acc.shape != pos.shape:
+                self.acc = np.empty_like(pos)
+            out = self.acc
+        out = self.kernel.accelerations(pos, self.masses, self.G, epsilon, targets=targets, out=out,
+                                        potential=potential)
+        self.force_evaluations += len(out)
+        return out
 
 
     def reset(self):
         """Reset simulation"""
-        self.velocities = self.init_v.copy()
-        self.positions = [self.init_p.copy()]
+        self._masses[...] = self.init_m
+        self._pos[...] = self.init_p
+        self._velocities[...] = self.init_v
+        self._ids[...] = np.arange(len(self._ids))
+        self.use_bodies(len(self._ids))
+        self.trail.clear()
+        self.trail.push(self.pos)
+        self.clear_cache()
         self.time = 0
+        self.steps = 0
+        self.energy_log.clear()
+        self.e0 = self.get_energy()
+        self.energy = self.e0
+        if self.neighbours is not None:
+            self.encounters = np.empty((0, 2), dtype=int)
+            self.encounter_count = 0
+            self.collision_count = 0
+            self.dissipated_energy = 0
         
 
-    def update(self):
-        """Update the state of the N bodies"""
-        dt = self.base_dt * self.time_scale
-        self.time += dt
-        
-        # Update velocities
-        self.velocities +=  self.get_acceleration(self.positions)*dt
-
-        # Update positions
-        pos = self.positions[-1] + self.velocities * dt
-        self.positions.append(pos)
-        if len(self.positions) > 50:
-            self.positions.pop(0)
-
-def plot_3d_nbody(max_t, n_bodies, masses, positions, velocities):
-    system = NbodySystem(n_bodies, masses, positions, velocities)
+    def advance(self, dt):
+        """One step of the integrator, or of the block time steps, then the collisions"""
+        if self.adaptive:
+            self.block_step(dt)
+        else:
+            super().advance(dt)
+        if self.neighbours is not None:
+            self.find_collisions()
+
+
+    def expand(self, values):
+        """Per-body values indexed by original body, NaN for bodies that were merged away"""
+        n_init = self.init_p.shape[-2]
+        if self.n == n_init:
+            return values
+        full = np.full((n_init, *values.shape[1:]), np.nan)
+        full[self.ids] = values
+        return full
+
+
+    def find_collisions(self):
+        """Record the close encounters of this step and merge touching bodies"""
+        pairs, distance = self.neighbours.pairs(self.pos)
+        if self.encounter_radius:
+            self.encounters = self.ids[pairs[distance < self.encounter_radius]]
+            self.encounter_count += len(self.encounters)
+        if self.merge_radius:
+            touching = pairs[distance < self.merge_radius]
+            if len(touching):
+                self.merge_bodies(touching)
+
+
+    def merge_bodies(self, pairs):
+        """Merge every group of bodies linked by the given pairs into one body.
+
+        Mass and momentum are conserved, the merged body sits at the centre
+        of mass. The surviving bodies are compacted in place in the storage
+        and in the trail history; the energy lost in the inelastic merge is
+        added to dissipated_energy and taken out of the drift reference e0.
+        """
+        energy_before = self.get_energy()
+
+        # Connected components: propagate the smallest index over the pairs
+        label = np.arange(self.n)
+        while True:
+            new = label.copy()
+            np.minimum.at(new, pairs[:, 0], label[pairs[:, 1]])
+            np.minimum.at(new, pairs[:, 1], label[pairs[:, 0]])
+            new = new[new]
+            if np.array_equal(new, label):
+                break
+            label = new
+
+        keep = np.flatnonzero(label == np.arange(self.n))
+        mass = np.bincount(label, weights=self.masses, minlength=self.n)[keep]
+        moment = np.stack([np.bincount(label, weights=self.masses * self.pos[:, k], minlength=self.n)
+                           for k in range(3)], axis=1)[keep]
+        momentum = np.stack([np.bincount(label, weights=self.masses * self.velocities[:, k], minlength=self.n)
+                             for k in range(3)], axis=1)[keep]
+        heavy = mass[:, np.newaxis] > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pos = np.where(heavy, moment / mass[:, np.newaxis], self.pos[keep])
+            vel = np.where(heavy, momentum / mass[:, np.newaxis], self.velocities[keep])
+
+        k = len(keep)
+        self._masses[:k] = mass
+        self._pos[:k] = pos
+        self._velocities[:k] = vel
+        self._ids[:k] = self.ids[keep]
+        self.trail.data[:, :k] = self.trail.data[:, keep]
+        self.collision_count += self.n - k
+        self.use_bodies(k)
+        self.clear_cache()
+
+        lost = energy_before - self.get_energy()
+        self.dissipated_energy += lost
+        self.e0 -= lost
+
+
+    def block_step(self, dt):
+        """Kick-drift-kick leapfrog with individual power-of-two time steps.
+
+        Every body gets the level l such that dt / 2**l is below its own time
+        step eta * sqrt(epsilon / |a|), so bodies in a close encounter substep
+        while the others keep the full dt. All bodies drift every substep, but
+        only the bodies at the end of their own step get a new force.
+        """
+        if self.cached_acc is None:
+            self.cached_acc = self.get_acceleration(self.pos).copy()
+        acc = self.cached_acc
+        phi = self.diagnostic_potential()
+
+        a = np.linalg.norm(acc, axis=1)
+        with np.errstate(divide="ignore"):
+            level = np.ceil(np.log2(dt * np.sqrt(a / epsilon) / self.eta))
+        level = np.clip(np.nan_to_num(level, neginf=0), 0, self.max_level).astype(int)
+
+        n_sub = 2**level.max()
+        h = dt / n_sub
+        stride = 2**(level.max() - level)   # Substeps per body step
+        body_dt = (h * stride)[:, np.newaxis]
+
+        for sub in range(n_sub):
+            start = sub % stride == 0
+            self.velocities[start] += 0.5 * body_dt[start] * acc[start]
+
+            self.pos += self.velocities * h
+
+            # The last substep ends every body, so it can also give the potential
+            end = np.flatnonzero((sub + 1) % stride == 0)
+            acc[end] = self.get_acceleration(self.pos, targets=end, out=np.empty((len(end), 3)),
+                                             potential=phi if sub == n_sub - 1 else None)
+            self.velocities[end] += 0.5 * body_dt[end] * acc[end]
+
+        self.cached_phi = phi
+
+
+class NbodyEnsemble(NbodyBase):
+    """B independent copies of an n-body system, advanced in lock-step.
+
+    Positions and velocities have shape (B, n, 3) and every step does one
+    batched force evaluation for the whole ensemble. Time, energy and the
+    energy drift log are tracked per member, and members can be reset on
+    their own. The fixed-step integrators are shared with NbodySystem.
+    """
+    def __init__(self, masses, positions, velocities, history=50, integrator="leapfrog",
+                 energy_every=10, energy_log=1000):
+        self.init_p = np.array(positions, dtype="float64")
+        self.init_v = np.array(velocities, dtype="float64")
+        if self.init_p.ndim != 3 or self.init_p.shape != self.init_v.shape:
+            raise ValueError("positions and velocities should both have shape (B, n, 3)")
+        self.members, self.n = self.init_p.shape[:2]
+        self.masses = np.broadcast_to(np.array(masses, dtype="float64"), (self.members, self.n)).copy()
+
+        self.pos = self.init_p.copy()
+        self._pos = self.pos   # Bodies are never merged away, the storage is the state itself
+        self.velocities = self.init_v.copy()
+        self.acc = np.empty(self.pos.shape)
+        self.time = np.zeros(self.members)
+
+        super().__init__(BatchedKernel(), history, integrator, energy_every, energy_log)
+
+
+    @classmethod
+    def perturbed(cls, members, masses, positions, velocities, scale=1e-3, seed=None, **kwargs):
+        """Ensemble of `members` copies of one system with Gaussian noise of size `scale` on the positions"""
+        rng = np.random.default_rng(seed)
+        positions = np.array(positions, dtype="float64")
+        velocities = np.array(velocities, dtype="float64")
+        noise = rng.normal(scale=scale, size=(members, *positions.shape))
+        noise[0] = 0  # Keep the unperturbed system as member 0
+        return cls(masses, positions + noise, np.broadcast_to(velocities, noise.shape), **kwargs)
+
+
+    def get_acceleration(self, pos, targets=None, out=None, potential=None):
+        """Returns the acceleration of every body of every member at positions pos, shape (B, n, 3)"""
+        if targets is not None:
+            raise ValueError("an ensemble always evaluates all bodies")
+        if out is None:
+            out = self.acc
+        out = self.kernel.accelerations(pos, self.masses, self.G, epsilon, out=out, potential=potential)
+        self.force_evaluations += self.members * self.n
+        return out
+
+
+    def reset(self, members=None):
+        """Reset all members, or only the given ones"""
+        if members is None:
+            members = slice(None)
+            self.trail.clear()
+            self.energy_log.clear()
+            self.steps = 0
+        self.pos[members] = self.init_p[members]
+        self.velocities[members] = self.init_v[members]
+        self.time[members] = 0
+        self.clear_cache()
+        if len(self.trail) == 0:
+            self.trail.push(self.pos)
+
+        energy = self.get_energy()
+        self.e0[members] = energy[members]
+        self.energy[members] = energy[members]
+
+
+def plot_3d_nbody(max_t, n_bodies, masses, positions, velocities, history=50, integrator="euler"):
+    # Plotting only, so the simulation itself also runs headless without matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from matplotlib.widgets import Slider
+    from body_renderer import BodyRenderer
+
+    system = NbodySystem(n_bodies, masses, positions, velocities, history=history, integrator=integrator)
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(projection='3d')
     colors = ["red", "blue", "green"]
 
-    # Plot the bodies
-    x, y, z = system.positions[-1].T
-    scatters = []
-    trails = []
-    
-    for i in range(n_bodies):
-        scatters.append(ax.scatter(x[i], y[i], z[i], s=masses[i]*50, color=colors[i % len(colors)]))
-        trails.append(ax.plot(x[i], y[i], z[i], color=colors[i % len(colors)], alpha=0.2)[0])
+    # Plot the bodies, every artist is created once and updated in place
+    renderer = BodyRenderer(ax, system.pos, [m*50 for m in masses],
+                            [colors[i % len(colors)] for i in range(n_bodies)])
 
     # Let's define the animation
     def update_animation(frame):
         system.update()
-        x, y, z = system.positions[-1].transpose()
-        xs = np.array([p[:, 0] for p in system.positions]).transpose()
-        ys = np.array([p[:, 1] for p in system.positions]).transpose()
-        zs = np.array([p[:, 2] for p in system.positions]).transpose()
-
-
-        for i in range(n_bodies):
-            scatters[i].remove()
-            scatters[i] = ax.scatter(x[i], y[i], z[i], s=masses[i]*50, color=colors[i % len(colors)])
-            trails[i].set_data_3d(xs[i], ys[i], zs[i])
+        renderer.set_positions(system.pos)
+        renderer.set_trails(system.positions)  # View on the ring buffer, shape (history, n, 3)
 
-        ax.set_title(f"N-Body: t = {system.time:.2f}, Energy = {system.get_energy():.2f}")
+        # Energy from the last diagnostic step, see NbodySystem.energy_every
+        renderer.set_text(f"N-Body: t = {system.time:.2f}, Energy = {system.energy:.2f}")
         if system.time > max_t:
             system.reset()
-        return scatters + trails,
+        return renderer.draw()
 
-    ani = FuncAnimation(fig, update_animation, frames=range(5000), blit=False)
+    ani = FuncAnimation(fig, update_animation, frames=range(5000), blit=True)
 
     # Add the Slider
     plt.subplots_adjust(bottom=0.25)
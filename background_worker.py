@@ -0,0 +1,67 @@
+import threading
+
+
+class LatestOnlyWorker():
+    """Runs compute(*args, cancelled=...) on a background thread, for the latest arguments only.
+
+    submit() never blocks: it replaces any request that has not started yet,
+    so a burst of slider events coalesces into one computation. A running
+    computation can poll cancelled() and give up early once it is stale;
+    stale results are dropped. The newest finished result is handed over
+    as a whole by take(), which the GUI thread can call every frame.
+    """
+    def __init__(self, compute):
+        self.compute = compute
+        self.completed = 0   # Results handed over
+        self.dropped = 0     # Requests coalesced away or results that were stale
+        self._condition = threading.Condition()
+        self._pending = None
+        self._generation = 0  # Number of the latest request
+        self._result = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        """Request a computation with these arguments, superseding all earlier requests"""
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._generation += 1
+            self._pending = (self._generation, args)
+            self._condition.notify()
+
+    def take(self):
+        """The newest result that has not been taken yet, or None"""
+        with self._condition:
+            result, self._result = self._result, None
+        return result
+
+    def close(self):
+        """Stop the worker thread, a running computation is told it is cancelled"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _stale(self, generation):
+        return self._closed or generation != self._generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                generation, args = self._pending
+                self._pending = None
+
+            result = self.compute(*args, cancelled=lambda: self._stale(generation))
+
+            with self._condition:
+                if result is None or self._stale(generation):
+                    self.dropped += 1
+                else:
+                    self._result = result
+                    self.completed += 1
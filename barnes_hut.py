@@ -0,0 +1,241 @@
+import numpy as np
+from nbody_kernels import softened_weights, finish_potential
+
+MAX_DEPTH = 21  # 3 * 21 bits of Morton key fit in an uint64
+
+
+def morton_keys(cells):
+    """Interleave the bits of integer cell coordinates, shape (n, 3), into Morton keys"""
+    keys = np.zeros(len(cells), dtype=np.uint64)
+    for axis in range(3):
+        v = cells[:, axis].astype(np.uint64)
+        v = (v | (v << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+        v = (v | (v << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+        v = (v | (v << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+        v = (v | (v << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+        v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+        keys |= v << np.uint64(2 - axis)
+    return keys
+
+
+class BarnesHutSolver():
+    """Barnes-Hut octree gravity, O(N log N) per force evaluation.
+
+    The tree is rebuilt from scratch on every call. Bodies are sorted along a
+    Morton curve so that every octree node is a contiguous range of the sorted
+    bodies, and the nodes are stored level by level in flat arrays (mass,
+    centre of mass, width, first child, number of children) instead of as
+    Python objects. Nodes holding at most `leaf_size` bodies are leaves.
+
+    The tree is walked once per group of `group_size` consecutive sorted
+    bodies, not once per body, vectorized over (group, node) pairs: a node
+    is accepted as a point mass for the whole group when width < theta *
+    distance to the group's bounding sphere, otherwise it is replaced by its
+    children, and opened leaves are summed body by body. The interaction
+    list of a group is then evaluated for all of its bodies as one dense
+    block, at most `chunk` body-source pairs at a time in scratch buffers
+    that are kept between calls. theta = 0 reduces to the direct sum.
+    """
+    def __init__(self, theta=0.5, leaf_size=8, group_size=32, chunk=2**15):
+        if theta < 0:
+            raise ValueError(f"theta should be >= 0, {theta} was given")
+        if leaf_size < 1:
+            raise ValueError(f"leaf_size should be >= 1, {leaf_size} was given")
+        if group_size < 1:
+            raise ValueError(f"group_size should be >= 1, {group_size} was given")
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.group_size = group_size
+        self.chunk = chunk
+        self._flat = np.empty(0)
+
+    def build(self, positions, masses):
+        """Build the octree of the given bodies"""
+        n = len(positions)
+        lo = positions.min(axis=0)
+        size = (positions.max(axis=0) - lo).max()
+        size = 1.0 if size <= 0 else size * (1 + 1e-9)
+
+        cells = np.minimum(((positions - lo) * (2**MAX_DEPTH / size)).astype(np.int64), 2**MAX_DEPTH - 1)
+        keys = morton_keys(cells)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        self.order = order
+
+        # Prefix sums give the mass and mass moment of any contiguous range of bodies
+        m = masses[order]
+        self.bodies = positions[order]
+        self.body_mass = m
+        cum_m = np.concatenate([[0.0], np.cumsum(m)])
+        cum_mx = np.concatenate([np.zeros((1, 3)), np.cumsum(m[:, np.newaxis] * (positions[order] - lo), axis=0)])
+
+        starts, counts, levels, parents = [np.array([0])], [np.array([n])], [np.array([0])], [np.array([-1])]
+        run_starts = np.array([0])
+        run_ids = np.array([0])
+        run_internal = np.array([n > self.leaf_size])
+        n_nodes = 1
+
+        for level in range(1, MAX_DEPTH + 1):
+            if not run_internal.any():
+                break
+            # Runs of equal key prefix are the occupied cells at this level
+            prefix = keys >> np.uint64(3 * (MAX_DEPTH - level))
+            new_starts = np.concatenate([[0], np.flatnonzero(prefix[1:] != prefix[:-1]) + 1])
+            new_counts = np.diff(np.append(new_starts, n))
+
+            # Only cells whose parent is not a leaf become nodes
+            parent_run = np.searchsorted(run_starts, new_starts, side="right") - 1
+            keep = run_internal[parent_run]
+            new_ids = np.full(len(new_starts), -1)
+            new_ids[keep] = n_nodes + np.arange(keep.sum())
+            n_nodes += keep.sum()
+
+            starts.append(new_starts[keep])
+            counts.append(new_counts[keep])
+            levels.append(np.full(keep.sum(), level))
+            parents.append(run_ids[parent_run[keep]])
+
+            run_starts = new_starts
+            run_ids = new_ids
+            run_internal = keep & (new_counts > self.leaf_size)
+
+        start = np.concatenate(starts)
+        count = np.concatenate(counts)
+        parent = np.concatenate(parents)
+
+        # Children of a node are contiguous, since both levels are sorted by key
+        self.first_child = np.zeros(n_nodes, dtype=np.int64)
+        self.n_children = np.zeros(n_nodes, dtype=np.int64)
+        ids, first, n_children = np.unique(parent[1:], return_index=True, return_counts=True)
+        self.first_child[ids] = first + 1
+        self.n_children[ids] = n_children
+
+        self.mass = cum_m[start + count] - cum_m[start]
+        moment = cum_mx[start + count] - cum_mx[start]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            com = moment / self.mass[:, np.newaxis]
+        massless = self.mass <= 0
+        com[massless] = self.bodies[start[massless]] - lo
+        self.com = com + lo
+        self.start = start
+        self.count = count
+        self.width = size / 2.0**np.concatenate(levels)
+        self.leaf = self.n_children == 0
+
+    def accelerations(self, positions, masses, G, epsilon, targets=None, out=None, potential=None):
+        """Acceleration of the target bodies (all bodies by default) due to all bodies.
+
+        When a `potential` array is given, the potential that every target
+        body feels is written into it, accepted nodes counting as point masses.
+        """
+        self.build(positions, masses)
+        n = len(positions)
+
+        # Sorted place of every target, and the groups of group_size consecutive
+        # sorted bodies holding them, which are compact along the Morton curve
+        rank = np.empty(n, dtype=np.int64)
+        rank[self.order] = np.arange(n)
+        wanted = rank if targets is None else rank[targets]
+        start = np.unique(wanted // self.group_size) * self.group_size
+        count = np.minimum(start + self.group_size, n) - start
+
+        # Sources are nodes as point masses followed by single bodies, component-major
+        bodies = np.ascontiguousarray(self.bodies.T)
+        points = np.concatenate([self.com.T, bodies], axis=1)
+        point_mass = np.concatenate([self.mass, self.body_mass])
+
+        acc = np.zeros((3, n))
+        phi = None if potential is None else np.zeros(n)
+        group, source = self._walk(start, count)
+        self._evaluate(start, count, group, points[:, source], point_mass[source], bodies, acc, phi, epsilon)
+
+        if out is None:
+            out = np.empty((len(wanted), 3))
+        out[...] = acc[:, wanted].T
+        out *= G
+        if potential is not None:
+            potential[...] = phi[wanted]
+            finish_potential(potential, masses if targets is None else masses[targets], G, epsilon)
+        return out
+
+    def _walk(self, start, count):
+        # Interaction lists of all groups as (group, source) pairs sorted by group,
+        # sources numbered as in accelerations()
+        ends = np.stack([start, start + count], axis=1).ravel()
+        padded = np.concatenate([self.bodies, self.bodies[-1:]])
+        lo, hi = np.minimum.reduceat(padded, ends)[::2], np.maximum.reduceat(padded, ends)[::2]
+        centre = (lo + hi) / 2
+        radius = np.sqrt(np.einsum("ij,ij->i", hi - lo, hi - lo)) / 2
+
+        group = np.arange(len(start))
+        node = np.zeros(len(start), dtype=np.int64)
+        groups, sources = [], []
+        while group.size:
+            r = self.com[node] - centre[group]
+            gap = np.sqrt(np.einsum("ij,ij->i", r, r)) - radius[group]
+            accept = self.width[node] < self.theta * gap
+            groups.append(group[accept])
+            sources.append(node[accept])
+
+            # Opened leaves are summed body by body
+            opened = self.leaf[node] & ~accept
+            n_bodies = self.count[node[opened]]
+            groups.append(np.repeat(group[opened], n_bodies))
+            sources.append(len(self.mass) + np.repeat(self.start[node[opened]], n_bodies) + self._offsets(n_bodies))
+
+            # Other opened nodes are replaced by their children, the pairs stay sorted by group
+            opened = ~self.leaf[node] & ~accept
+            group, node = group[opened], node[opened]
+            n_children = self.n_children[node]
+            group = np.repeat(group, n_children)
+            node = np.repeat(self.first_child[node], n_children) + self._offsets(n_children)
+
+        # Every pass is sorted already, which a stable sort merges cheaply
+        group, source = np.concatenate(groups), np.concatenate(sources)
+        by_group = np.argsort(group, kind="stable")
+        return group[by_group], source[by_group]
+
+    def _evaluate(self, start, count, group, points, point_mass, bodies, acc, phi, epsilon):
+        # All bodies of a group against all sources of its list as one dense
+        # block; groups with similar list lengths share a chunk, so that little
+        # is padded, and the scratch buffers are kept between calls
+        size = count.max()
+        offsets = np.arange(size)
+        first = np.searchsorted(group, np.arange(len(start) + 1))
+        lengths = np.diff(first)
+        order = np.argsort(lengths, kind="stable")
+
+        i = 0
+        while i < len(order):
+            k = max(1, self.chunk // (size * lengths[order[i]]))
+            while k > 1 and k * size * lengths[order[min(i + k, len(order)) - 1]] > self.chunk:
+                k //= 2
+            chunk = order[i:i + k]
+            i += len(chunk)
+
+            # Sources padded with massless copies of the last one, bodies with copies of the last body
+            slots = np.arange(lengths[chunk].max())
+            pairs = np.minimum(first[chunk, np.newaxis] + slots, first[chunk + 1, np.newaxis] - 1)
+            m = np.where(slots < lengths[chunk, np.newaxis], point_mass[pairs], 0)[:, np.newaxis, :]
+            index = np.minimum(start[chunk, np.newaxis] + offsets, start[chunk, np.newaxis] + count[chunk, np.newaxis] - 1)
+            inside = offsets < count[chunk, np.newaxis]
+
+            shape = (len(chunk), size, len(slots))
+            cells = np.prod(shape)
+            if 6 * cells > len(self._flat):
+                self._flat = np.empty(6 * cells)
+            diff = self._flat[:3 * cells].reshape(3, *shape)     # Source minus body, per component
+            dist, tmp, pot = (self._flat[j * cells:(j + 1) * cells].reshape(shape) for j in (3, 4, 5))
+
+            np.subtract(points[:, pairs][:, :, np.newaxis, :], bodies[:, index][..., np.newaxis], out=diff)
+            softened_weights(diff, m, epsilon, dist, tmp, None if phi is None else pot)
+
+            group_acc = np.matmul(diff.transpose(1, 2, 0, 3), dist[..., np.newaxis])[..., 0]
+            acc[:, index[inside]] = group_acc[inside].T
+            if phi is not None:
+                phi[index[inside]] = pot.sum(axis=2)[inside]
+
+    @staticmethod
+    def _offsets(counts):
+        # 0, 1, ..., c - 1 for every entry c of counts, concatenated
+        return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
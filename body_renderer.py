@@ -0,0 +1,74 @@
+import numpy as np
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+
+class BodyRenderer():
+    """Persistent, blittable artists for a set of bodies on a 3D axes.
+
+    All bodies share a single Path3DCollection and all trails a single
+    Line3DCollection; both are created once and updated in place. The
+    artists are animated, so they are left out of the cached background
+    and only they are redrawn by FuncAnimation(..., blit=True). Restoring the
+    background wipes every artist drawn in the previous frame, so draw()
+    always returns all animated artists, while the static ones (panes,
+    ticks, the star) are never redrawn. Setters mark artists dirty, and only
+    dirty artists are projected again.
+    """
+    def __init__(self, ax, positions, sizes, colors, trails=True, trail_alpha=0.2):
+        x, y, z = np.asarray(positions, dtype="float64").T
+        self.ax = ax
+        self.bodies = ax.scatter(x, y, z, s=sizes, c=colors, depthshade=False, animated=True)
+
+        self.trails = None
+        if trails:
+            self.trails = Line3DCollection([np.c_[x, y, z][i:i + 1] for i in range(len(x))],
+                                           colors=colors, alpha=trail_alpha, animated=True)
+            ax.add_collection(self.trails)
+
+        self.label = ax.text2D(0.02, 0.95, "", transform=ax.transAxes, animated=True)
+        self.extra = []
+        self.dirty = set(self.artists())
+
+    def artists(self):
+        """Every animated artist of the renderer"""
+        return [a for a in [self.bodies, self.trails, self.label] if a is not None] + self.extra
+
+    def add(self, artist):
+        """Manage an extra artist, e.g. an orbit outline that only changes now and then"""
+        artist.set_animated(True)
+        self.extra.append(artist)
+        self.dirty.add(artist)
+        return artist
+
+    def touch(self, artist):
+        """Mark an artist that was changed from outside the renderer as dirty"""
+        self.dirty.add(artist)
+
+    def set_positions(self, positions):
+        """New body positions, shape (n, 3)"""
+        self.bodies._offsets3d = tuple(np.asarray(positions).T)
+        self.dirty.add(self.bodies)
+
+    def set_sizes(self, sizes):
+        self.bodies.set_sizes(sizes)
+        self.dirty.add(self.bodies)
+
+    def set_trails(self, history):
+        """New trails from a position history of shape (length, n, 3)"""
+        self.trails.set_segments(np.swapaxes(history, 0, 1))
+        self.dirty.add(self.trails)
+
+    def set_text(self, text):
+        if text != self.label.get_text():
+            self.label.set_text(text)
+            self.dirty.add(self.label)
+
+    def draw(self):
+        """Artists to redraw this frame, to be returned from the animation callback"""
+        # Blitting draws the artists one by one, without the projection step
+        # that Axes3D.draw normally runs for 3D collections
+        for artist in self.dirty:
+            if hasattr(artist, "do_3d_projection"):
+                artist.do_3d_projection()
+        self.dirty.clear()
+        return self.artists()
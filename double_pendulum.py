@@ -1,16 +1,154 @@
+import numpy as np
+from ring_buffer import RingBuffer
+
+
 class DoublePendulum():
-    def __init__(self, masses, lengths, angles)
-        self.theta1, self.theta2 = angles
-        self.m1, self.m2 = masses
-        self.l1, self.l2 = lengths
-        self.theta1, self.theta2 = angles
-        self.omega1, self.omega2 = 0,0
-        self.dt = 0.05
+    """One double pendulum, or a whole ensemble of them advanced in lock-step.
+
+    masses, lengths, angles and velocities are (m1, m2), (l1, l2),
+    (theta1, theta2) and (omega1, omega2) pairs whose entries can be arrays;
+    they are broadcast to one ensemble shape, so a single update advances
+    every pendulum with one RK4 step on arrays. Angles are measured from the
+    downward vertical. The last `history` positions of both bobs are kept in
+    a ring buffer, see get_paths. Nothing here needs matplotlib.
+    """
+    def __init__(self, masses, lengths, angles, velocities=(0, 0), gravity=9.81, dt=0.05, history=50):
+        values = np.broadcast_arrays(*(np.asarray(v, dtype="float64") for v in
+                                       (*masses, *lengths, *angles, *velocities)))
+        self.m1, self.m2, self.l1, self.l2 = (v.copy() for v in values[:4])
+        self.shape = values[0].shape
+
+        # State theta1, theta2, omega1, omega2, shape (4, *shape)
+        self.state = np.stack(values[4:])
+        self.init_state = self.state.copy()
+        self.g = gravity
+        self.dt = dt
         self.time = 0
-        self.paths = [[], []]
 
-    def update(self):
-        
+        # Positions of the last steps, every entry has shape (*shape, bob, xy)
+        self.paths = RingBuffer(history, (*self.shape, 2, 2))
+        self.paths.push(self.positions())
+
+    @property
+    def theta1(self):
+        return self.state[0]
+
+    @property
+    def theta2(self):
+        return self.state[1]
+
+    @property
+    def omega1(self):
+        return self.state[2]
+
+    @property
+    def omega2(self):
+        return self.state[3]
+
+    def derivatives(self, state):
+        """Time derivative of a state of shape (4, *shape), from the full nonlinear equations of motion"""
+        theta1, theta2, omega1, omega2 = state
+        m1, m2, l1, l2, g = self.m1, self.m2, self.l1, self.l2, self.g
+        delta = theta1 - theta2
+        sin_d, cos_d = np.sin(delta), np.cos(delta)
+        den = 2*m1 + m2 - m2*np.cos(2*delta)
+
+        alpha1 = (-g*(2*m1 + m2)*np.sin(theta1) - m2*g*np.sin(theta1 - 2*theta2)
+                  - 2*sin_d*m2*(omega2**2*l2 + omega1**2*l1*cos_d)) / (l1*den)
+        alpha2 = (2*sin_d*(omega1**2*l1*(m1 + m2) + g*(m1 + m2)*np.cos(theta1)
+                           + omega2**2*l2*m2*cos_d)) / (l2*den)
+        return np.stack([omega1, omega2, alpha1, alpha2])
+
+    def step(self, dt):
+        """One classical RK4 step of every pendulum"""
+        y = self.state
+        k1 = self.derivatives(y)
+        k2 = self.derivatives(y + 0.5*dt*k1)
+        k3 = self.derivatives(y + 0.5*dt*k2)
+        k4 = self.derivatives(y + dt*k3)
+        y += dt / 6 * (k1 + 2*k2 + 2*k3 + k4)
 
     def update(self):
-        ...
+        """Advance by dt and record the new positions"""
+        self.step(self.dt)
+        self.time += self.dt
+        self.paths.push(self.positions())
+
+    def run(self, steps):
+        """Advance by `steps` steps without recording anything, e.g. for headless ensembles"""
+        for _ in range(steps):
+            self.step(self.dt)
+        self.time += steps * self.dt
+
+    def keep(self, mask):
+        """Drop the members of a one-dimensional ensemble where mask is False"""
+        self.m1, self.m2, self.l1, self.l2 = self.m1[mask], self.m2[mask], self.l1[mask], self.l2[mask]
+        self.state = self.state[:, mask]
+        self.init_state = self.init_state[:, mask]
+        self.shape = self.m1.shape
+        self.paths = RingBuffer(self.paths.capacity, (*self.shape, 2, 2))
+        self.paths.push(self.positions())
+
+    def positions(self):
+        """Positions of both bobs, shape (*shape, 2, 2) as [..., bob, (x, y)], the pivot at the origin"""
+        x1 = self.l1 * np.sin(self.theta1)
+        y1 = -self.l1 * np.cos(self.theta1)
+        x2 = x1 + self.l2 * np.sin(self.theta2)
+        y2 = y1 - self.l2 * np.cos(self.theta2)
+        return np.stack([np.stack([x1, y1], axis=-1), np.stack([x2, y2], axis=-1)], axis=-2)
+
+    def get_paths(self):
+        """The last positions, oldest first, shape (steps, *shape, 2, 2), no copy"""
+        return self.paths.view()
+
+    def energy(self):
+        """Total energy of every pendulum, shape (*shape)"""
+        theta1, theta2, omega1, omega2 = self.state
+        kinetic = (0.5*(self.m1 + self.m2)*self.l1**2*omega1**2 + 0.5*self.m2*self.l2**2*omega2**2
+                   + self.m2*self.l1*self.l2*omega1*omega2*np.cos(theta1 - theta2))
+        potential = -(self.m1 + self.m2)*self.g*self.l1*np.cos(theta1) - self.m2*self.g*self.l2*np.cos(theta2)
+        return kinetic + potential
+
+    def reset(self):
+        self.state[...] = self.init_state
+        self.time = 0
+        self.paths.clear()
+        self.paths.push(self.positions())
+
+
+def plot_double_pendulum(max_t, masses, lengths, angles, history=50):
+    # Plotting only, so the engine itself also runs headless without matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    pendulum = DoublePendulum(masses, lengths, angles, history=history)
+    reach = float(np.max(pendulum.l1 + pendulum.l2)) * 1.1
+
+    fig, ax = plt.subplots(figsize=(8,8))
+    ax.scatter([0], [0], color="black", s=50)
+    rods, = ax.plot([], [], "o-", color="red", lw=2)
+    trail, = ax.plot([], [], color="blue", alpha=0.3)
+
+    ax.set_xlim(-reach, reach)
+    ax.set_ylim(-reach, reach)
+    ax.set_aspect('equal')
+    ax.grid(True)
+
+    def update_animation(frame):
+        if pendulum.time >= max_t:
+            pendulum.reset()
+        pendulum.update()
+
+        (x1, y1), (x2, y2) = pendulum.positions().reshape(-1, 2, 2)[0]
+        rods.set_data([0, x1, x2], [0, y1, y2])
+        path = pendulum.get_paths().reshape(len(pendulum.paths), -1, 2, 2)[:, 0, 1]
+        trail.set_data(path[:, 0], path[:, 1])
+        ax.set_title(f"Double pendulum: t = {pendulum.time:.2f}")
+        return rods, trail
+
+    ani = FuncAnimation(fig, update_animation, interval=50, cache_frame_data=False)
+    plt.show()
+
+
+if __name__ == "__main__":
+    plot_double_pendulum(20, (1, 1), (1, 1), (np.pi / 2, np.pi / 2))
@@ -3,26 +3,123 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Slider
 import itertools
+from ring_buffer import DecimatedHistory
+
+
+# Kinds of planet: a grow planet gains mass, a shrink planet spirals inwards
+KINDS = {"planet": 0, "grow": 1, "shrink": 2}
+GROWTH_RATE = 0.01  # Mass gained per unit of time by a grow planet
+SHRINK_RATE = 0.1   # Distance lost per unit of time by a shrink planet
 
 
 class EvolvingSystem():
-    def __init__(self, planets_data):
-        self.planets = [GrowingPlanet(m, d) if t == "grow" else
-                        ShrinkingPlanet(m,d) if t == "shrink" else
-                        Planet(m,d) for (t,m,d) in planets_data]
+    """Planets on circular orbits around a star, stored as a struct of arrays.
+
+    Mass, distance, angle and kind of all planets live in contiguous arrays,
+    so a step updates every planet with a few vectorized operations instead
+    of a method call per planet. The growth and shrink rules act
+    through masks of the kind array.
+
+    The path history has a fixed capacity: the last `history` positions at
+    full resolution and, with levels > 0, older positions thinned out by
+    `factor` per level, so memory and the cost of get_paths stay constant.
+    """
+    def __init__(self, planets_data, history=50, levels=0, factor=4):
+        kinds, masses, distances = zip(*planets_data) if len(planets_data) else ((), (), ())
+        kinds = np.array(kinds, dtype=str)
+        self.kind = np.zeros(len(kinds), dtype=np.int8)  # Any other kind is a plain planet
+        self.kind[kinds == "grow"] = KINDS["grow"]
+        self.kind[kinds == "shrink"] = KINDS["shrink"]
+        self.m_init = np.array(masses, dtype="float64")
+        self.d_init = np.array(distances, dtype="float64")
+        self.mass = self.m_init.copy()
+        self.distance = self.d_init.copy()
+        self.theta = np.zeros(len(self.kind))
+        self.G = 1
+
+        # Rates per planet, zero where the rule does not apply
+        self.mass_rate = np.where(self.kind == KINDS["grow"], GROWTH_RATE, 0.0)
+        self.distance_rate = np.where(self.kind == KINDS["shrink"], -SHRINK_RATE, 0.0)
+        self.growing = bool(np.any(self.mass_rate))
+        self.shrinking = bool(np.any(self.distance_rate))
+
         self.dt = 0.1
         self.time_scale = 1
         self.time = 0
-        self.paths = [[] for p in self.planets]
+        self.paths = DecimatedHistory(history, (len(self.kind), 2), levels, factor)
         self.Ms = 1000
 
 
     def reset(self):
         # Reset the system to how it started
         self.time = 0
-        self.paths = [[] for p in self.planets]
-        for planet in self.planets:
-            planet.reset()
+        self.paths.clear()
+        self.mass[...] = self.m_init
+        self.distance[...] = self.d_init
+        self.theta[...] = 0
+
+
+    def step(self, dt):
+        """Advance all planets by dt, returns their positions before the angle update, shape (n, 2)"""
+        if self.growing:
+            self.mass += self.mass_rate * dt
+        if self.shrinking:
+            self.distance += self.distance_rate * dt
+
+        positions = np.empty((len(self.kind), 2))
+        np.cos(self.theta, out=positions[:, 0])
+        np.sin(self.theta, out=positions[:, 1])
+        positions *= self.distance[:, np.newaxis]
+
+        self.theta += np.sqrt(self.G * self.Ms / self.distance**3) * dt
+        return positions
+
+
+    def distances_at(self, t):
+        """Distance of every planet at the times t, shape (*t.shape, n)"""
+        t = np.asarray(t, dtype="float64")[..., np.newaxis]
+        return self.d_init + self.distance_rate * t
+
+    def masses_at(self, t):
+        """Mass of every planet at the times t, shape (*t.shape, n)"""
+        t = np.asarray(t, dtype="float64")[..., np.newaxis]
+        return self.m_init + self.mass_rate * t
+
+    def phases_at(self, t):
+        """Orbit angle of every planet at the times t, shape (*t.shape, n).
+
+        The angular velocity is sqrt(G Ms / d^3). For a shrink planet d falls
+        linearly, d(t) = d0 - r t, and the angle is the closed-form integral
+        2 sqrt(G Ms) / r (d(t)^-1/2 - d0^-1/2). Once a planet has reached the
+        star the angle is NaN.
+        """
+        t = np.asarray(t, dtype="float64")[..., np.newaxis]
+        w = np.sqrt(self.G * self.Ms)
+        rate = -self.distance_rate
+        distance = self.d_init - rate * t
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shrinking = 2 * w / np.where(rate > 0, rate, 1) * (distance**-0.5 - self.d_init**-0.5)
+            phase = np.where(rate > 0, shrinking, w * self.d_init**-1.5 * t)
+        return np.where(distance > 0, phase, np.nan)
+
+    def positions_at(self, t):
+        """Positions of all planets at the times t in one vectorized call, shape (*t.shape, n, 2).
+
+        The orbits are evaluated in closed form for the current star mass, so
+        any time can be reached directly. update_system adds up the angle in
+        steps of dt, so it agrees with this up to first order in dt.
+        """
+        phase = self.phases_at(t)
+        distance = self.distances_at(t)
+        return np.stack([distance * np.cos(phase), distance * np.sin(phase)], axis=-1)
+
+    def seek(self, t):
+        """Jump to time t, update_system continues from there"""
+        self.time = t
+        self.mass[...] = self.masses_at(t)
+        self.distance[...] = self.distances_at(t)
+        self.theta[...] = self.phases_at(t)
+        self.paths.clear()
 
 
     def update_system(self):
@@ -30,21 +127,16 @@ class EvolvingSystem():
         while True:
 
             self.time += self.time_scale * self.dt
-            positions = [planet.update(self.time_scale * self.dt, self.Ms) for planet in self.planets]
+            positions = self.step(self.time_scale * self.dt)
 
             # Add the positons to the paths
-            for path, pos in zip(self.paths, positions):
-                path.append(pos)
-
-
-            if len(self.paths[0]) > 50:
-                (path.pop(0) for path in self.paths)
+            self.paths.push(positions)
 
             # Yield the positons
-            yield np.array(positions)
+            yield positions
 
     def get_planet_masses(self):
-        return np.array([planet.mass for planet in self.planets])
+        return self.mass.copy()
 
     def set_star_mass(self, Ms):
         self.Ms = Ms
@@ -53,72 +145,12 @@ class EvolvingSystem():
         self.time_scale = ts
 
     def get_paths(self):
-        return self.paths
-
-        
-
-    
-
-
-
-
-class Planet():
-    def __init__(self, mass, distance):
-        # Constructor of the Planet class
-        self.mass = mass
-        self.distance = distance
-        self.theta = 0
-        self.G = 1
-
-    def update(self, dt, Ms):
-        """Get the positions of the planet"""
-        x = self.distance * np.cos(self.theta)
-        y = self.distance * np.sin(self.theta)
-
-        self.theta += np.sqrt(self.G * Ms / self.distance**3) * dt
-        return np.array([x, y])
-
-    def reset(self):
-        self.theta = 0
-
-
-
-class GrowingPlanet(Planet):
-    def __init__(self, mass, distance):
-        self.m_init = mass
-        super().__init__(mass, distance)
-
-    def update(self, dt, Ms):
-        # Update changes the mass 
-        self.mass += 0.01*dt
-        return super().update(dt, Ms)
-
-    def reset(self):
-        # Reset should also reset the mass
-        self.mass = self.m_init
-        super().reset()
-            
-
-class ShrinkingPlanet(Planet):
-    def __init__(self, mass, distance):
-        self.d_init = distance
-        super().__init__(mass, distance)
-
-    def update(self, dt, Ms):
-        # Update changes the distance
-        self.distance -= 0.1*dt
-        return super().update(dt, Ms)
-
-    def reset(self):
-        # Reset also resets the distance
-        self.distance = self.d_init
-        super().reset()
-
-
+        """Path of every planet, oldest point first, shape (n, points, 2)"""
+        return np.swapaxes(self.paths.view(), 0, 1)
 
 
-def plot_evolving_system(max_t, planets_data):
-    system = EvolvingSystem(planets_data)
+def plot_evolving_system(max_t, planets_data, history=50, levels=0):
+    system = EvolvingSystem(planets_data, history, levels)
     positions = system.update_system()
     masses = system.get_planet_masses()
     colors = list(itertools.islice(["red", "blue", "green"], len(planets_data)))
@@ -137,7 +169,7 @@ def plot_evolving_system(max_t, planets_data):
     paths = system.get_paths()
 
     for color, path in zip(colors, paths):
-        [x, y] = np.array(path).transpose()
+        [x, y] = path.transpose()
         planet_paths.append(ax.plot(x, y, color=color, alpha=0.2)[0])
 
 
@@ -153,7 +185,7 @@ def plot_evolving_system(max_t, planets_data):
         paths = system.get_paths()
 
         for planet_path, path in zip(planet_paths, paths):
-            [x,y] = np.array(path).transpose()
+            [x,y] = path.transpose()
             planet_path.set_data(x, y)
 
         if system.time >= max_t:
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from double_pendulum import DoublePendulum
+
+
+def flip_times(theta1, theta2, max_t=10.0, dt=0.01, masses=(1, 1), lengths=(1, 1), gravity=9.81):
+    """Time until either arm of a double pendulum released at rest first flips over the top.
+
+    theta1 and theta2 are 1D arrays of initial angles. Pendulums that do not
+    have the energy to flip are never integrated, and pendulums that have
+    flipped are dropped from the batch, so the work shrinks as the map
+    fills in. NaN means no flip within max_t.
+    """
+    theta1 = np.asarray(theta1, dtype="float64")
+    theta2 = np.asarray(theta2, dtype="float64")
+    times = np.full(theta1.shape, np.nan)
+
+    # Released at rest, a flip needs at least the potential energy of one arm upright
+    m1, m2 = masses
+    l1, l2 = lengths
+    energy = -(m1 + m2)*gravity*l1*np.cos(theta1) - m2*gravity*l2*np.cos(theta2)
+    needed = min((m1 + m2)*gravity*l1 - m2*gravity*l2, -(m1 + m2)*gravity*l1 + m2*gravity*l2)
+    active = np.flatnonzero(energy >= needed)
+    if not len(active):
+        return times
+
+    pendulum = DoublePendulum(masses, lengths, (theta1[active], theta2[active]), gravity=gravity, dt=dt, history=1)
+    done = np.zeros(len(active), dtype=bool)
+    t = 0.0
+    while t < max_t and len(active):
+        pendulum.step(dt)
+        t += dt
+        flipped = ~done & ((np.abs(pendulum.theta1) > np.pi) | (np.abs(pendulum.theta2) > np.pi))
+        times[active[flipped]] = t
+        done |= flipped
+
+        # Compact the batch once a quarter of it has flipped
+        if 4 * done.sum() >= len(done):
+            pendulum.keep(~done)
+            active = active[~done]
+            done = np.zeros(len(active), dtype=bool)
+    return times
+
+
+def _tile_key(level, row, column, tile, settings):
+    # Tiles are identified by their place on the global lattice and the physics settings
+    description = json.dumps({"level": level, "row": row, "column": column, "tile": tile, **settings}, sort_keys=True)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _tile_angles(level, index, tile):
+    # Pixel-centre angles of the index-th tile along one axis of the lattice
+    step = 2 * np.pi / (tile * 2**level)
+    return -np.pi + (index * tile + np.arange(tile) + 0.5) * step
+
+
+def _render_tile(theta1, theta2, settings, path):
+    # One tile in a worker process, stored on disk when a cache path is given
+    t1, t2 = np.meshgrid(theta1, theta2)
+    tile = flip_times(t1.ravel(), t2.ravel(), **settings).reshape(t1.shape)
+    if path is not None:
+        temporary = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(temporary, tile)
+        os.replace(temporary, path)  # Never leave a half-written tile behind
+    return tile
+
+
+def flip_fractal(resolution=2048, theta1_range=(-np.pi, np.pi), theta2_range=(-np.pi, np.pi), tile=256,
+                 max_t=10.0, dt=0.01, masses=(1, 1), lengths=(1, 1), gravity=9.81,
+                 workers=None, cache_dir="flip_cache"):
+    """Flip-time map over a resolution x resolution grid of initial (theta1, theta2).
+
+    Row i, column j is released at theta2 = row i, theta1 = column j of the
+    pixel-centre grids over the two ranges. The pixels are not integrated
+    themselves: they are looked up on a fixed global lattice of tiles of
+    tile x tile pixels. Level 0 is one tile over [-pi, pi]^2 and every
+    level halves the lattice pixels; the view uses the coarsest level whose
+    pixels are no larger than its own. Missing tiles are integrated as
+    vectorized batches in a process pool, and every finished tile is stored
+    in cache_dir (None to disable) under its (level, row, column) and the
+    physics settings, so re-renders, pans and zooms within a level only
+    compute the tiles they have not seen before.
+    """
+    if resolution < 1 or tile < 1:
+        raise ValueError(f"resolution and tile should be >= 1, {resolution} and {tile} were given")
+    settings = {"max_t": float(max_t), "dt": float(dt), "masses": [float(m) for m in masses],
+                "lengths": [float(l) for l in lengths], "gravity": float(gravity)}
+    centres = (np.arange(resolution) + 0.5) / resolution
+    theta1 = theta1_range[0] + (theta1_range[1] - theta1_range[0]) * centres
+    theta2 = theta2_range[0] + (theta2_range[1] - theta2_range[0]) * centres
+
+    # Lattice level and the lattice pixel of every view pixel
+    pixel = min(abs(theta1_range[1] - theta1_range[0]), abs(theta2_range[1] - theta2_range[0])) / resolution
+    level = max(0, int(np.ceil(np.log2(2 * np.pi / (tile * pixel)) - 1e-9)))
+    step = 2 * np.pi / (tile * 2**level)
+    columns = np.floor((theta1 + np.pi) / step).astype(np.int64)
+    rows = np.floor((theta2 + np.pi) / step).astype(np.int64)
+    first_row, first_column = rows.min() // tile, columns.min() // tile
+    tile_rows = range(first_row, rows.max() // tile + 1)
+    tile_columns = range(first_column, columns.max() // tile + 1)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Only the tiles some view pixel falls in, assembled in one mosaic
+    mosaic = np.empty((len(tile_rows) * tile, len(tile_columns) * tile))
+    used = np.zeros((len(tile_rows), len(tile_columns)), dtype=bool)
+    used[np.ix_(np.unique(rows // tile) - first_row, np.unique(columns // tile) - first_column)] = True
+    todo = []
+    for row, column in zip(*np.nonzero(used)):
+        t1 = _tile_angles(level, first_column + column, tile)
+        t2 = _tile_angles(level, first_row + row, tile)
+        path = None
+        if cache_dir is not None:
+            key = _tile_key(level, int(first_row + row), int(first_column + column), tile, settings)
+            path = os.path.join(cache_dir, key + ".npy")
+            if os.path.exists(path):
+                mosaic[row * tile:(row + 1) * tile, column * tile:(column + 1) * tile] = np.load(path)
+                continue
+        todo.append((row, column, t1, t2, path))
+
+    if todo:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [(row, column, pool.submit(_render_tile, t1, t2, settings, path))
+                       for row, column, t1, t2, path in todo]
+            for row, column, future in futures:
+                mosaic[row * tile:(row + 1) * tile, column * tile:(column + 1) * tile] = future.result()
+    return mosaic[np.ix_(rows - first_row * tile, columns - first_column * tile)]
+
+
+def plot_flip_fractal(resolution=512, **kwargs):
+    # Plotting only, the generator itself runs headless
+    import matplotlib.pyplot as plt
+
+    image = flip_fractal(resolution, **kwargs)
+    extent = [*kwargs.get("theta1_range", (-np.pi, np.pi)), *kwargs.get("theta2_range", (-np.pi, np.pi))]
+
+    fig, ax = plt.subplots(figsize=(8,8))
+    with np.errstate(divide="ignore"):
+        shown = ax.imshow(np.log10(image), origin="lower", extent=extent, cmap="magma")
+    fig.colorbar(shown, ax=ax, label="log10 time until first flip")
+    ax.set_xlabel("theta1")
+    ax.set_ylabel("theta2")
+    ax.set_title("Double pendulum flip time")
+    plt.show()
+
+
+if __name__ == "__main__":
+    plot_flip_fractal(512)
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import numpy as np
+
+
+class FrameCache():
+    """In-memory LRU cache of precomputed frame blocks.
+
+    Keys are built from quantized parameters, rounded to `digits`
+    significant digits, so slider positions that are close enough share one
+    entry. Values are tuples of NumPy arrays; the cache holds at most
+    `max_bytes` of them and evicts the least recently used entries first.
+    """
+    def __init__(self, max_bytes=64 * 2**20, digits=3):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes should be >= 0, {max_bytes} was given")
+        self.max_bytes = max_bytes
+        self.digits = digits
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, value):
+        """value rounded to the significant digits of the cache"""
+        return float(f"{value:.{self.digits}g}")
+
+    def key(self, *values):
+        """Hashable key of numbers (quantized) and arrays (by content)"""
+        return tuple((v.shape, v.tobytes()) if isinstance(v, np.ndarray) else self.quantize(v) for v in values)
+
+    def get(self, key):
+        """Cached value or None, a hit makes the entry the most recently used"""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        size = sum(array.nbytes for array in value)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        if key in self.entries:
+            self.bytes -= sum(array.nbytes for array in self.entries.pop(key))
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= sum(array.nbytes for array in old)
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, computed with compute() and stored on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,27 @@
+from collections import deque
+import itertools
+
+
+class ReadAhead():
+    """Iterator that pulls frames lazily from an iterable through a small buffer.
+
+    At most `size` frames are read ahead, in one batch whenever the buffer
+    runs empty, so memory stays bounded however long the source runs and
+    the first frame is available as soon as the source produced it.
+    """
+    def __init__(self, frames, size=16):
+        if size < 1:
+            raise ValueError(f"size should be >= 1, {size} was given")
+        self.source = iter(frames)
+        self.size = size
+        self.buffer = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.buffer:
+            self.buffer.extend(itertools.islice(self.source, self.size))
+            if not self.buffer:
+                raise StopIteration
+        return self.buffer.popleft()
@@ -3,60 +3,111 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Slider
+from body_renderer import BodyRenderer
+from frame_cache import FrameCache
+from planetary_orbits import solve_kepler
 
 G = 1
 
 
-
-class Planet():
-    def __init__(self, mass_star, distance, eccentricity):
-
-        self.d = distance
-        self.e = eccentricity
-        self.s_mass = mass_star
-
+class KeplerOrbits():
+    """Keplerian orbits of many bodies around one star, stored as arrays.
+
+    Every body has a semi-major axis a, eccentricity e, inclination i,
+    longitude of the ascending node node, argument of periapsis peri (angles
+    in radians) and mean anomaly at t = 0. The position follows from
+    Kepler's equation in the orbital plane, which is turned into space by
+    the rotation matrix Rz(node) Rx(i) Rz(peri) of every body; the matrices
+    are computed in one batch whenever the elements change. Orbit outlines
+    are cached per element set, so returning to earlier slider values does
+    not recompute them.
+    """
+    def __init__(self, mass_star, a, e=0.0, i=0.0, node=0.0, peri=0.0, mean_anomaly=0.0, dt=0.1):
+        self.mass_star = mass_star
+        self.dt = dt
         self.t = 0
-        self.theta = 0
-
-        
-
-    def update(self):
-        self.t += 0.1
-        self.theta += np.sqrt(G* self.s_mass / self.d**3)*0.1
+        self.outlines = FrameCache()
+        self.set_elements(a, e, i, node, peri, mean_anomaly)
+
+    @classmethod
+    def synthetic(cls, n, mass_star=1000, a_range=(2, 15), max_e=0.3, max_i=0.2, seed=None, **kwargs):
+        """A random planetary system of n bodies with mildly eccentric, mildly inclined orbits"""
+        rng = np.random.default_rng(seed)
+        return cls(mass_star, rng.uniform(*a_range, n), rng.uniform(0, max_e, n), rng.uniform(0, max_i, n),
+                   rng.uniform(0, 2*np.pi, n), rng.uniform(0, 2*np.pi, n), rng.uniform(0, 2*np.pi, n), **kwargs)
+
+    def set_elements(self, a=None, e=None, i=None, node=None, peri=None, mean_anomaly=None):
+        """Change some of the orbital elements, the others are kept"""
+        elements = dict(a=a, e=e, i=i, node=node, peri=peri, mean_anomaly=mean_anomaly)
+        elements = {name: getattr(self, name) if value is None else value for name, value in elements.items()}
+        n = max(np.size(value) for value in elements.values())
+        elements = {name: np.broadcast_to(np.asarray(value, dtype="float64"), (n,)).copy()
+                    for name, value in elements.items()}
+        if np.any(elements["e"] < 0) or np.any(elements["e"] >= 1):
+            raise ValueError(f"e should be in [0, 1), {elements['e']} was given")
+
+        # Only assigned once valid, so a rejected change leaves the orbits as they were
+        for name, value in elements.items():
+            setattr(self, name, value)
+        self.n = n
+        self.rotation = self._rotations()
+
+    def _rotations(self):
+        # Rz(node) Rx(i) Rz(peri) for every body, shape (n, 3, 3)
+        cn, sn = np.cos(self.node), np.sin(self.node)
+        ci, si = np.cos(self.i), np.sin(self.i)
+        cp, sp = np.cos(self.peri), np.sin(self.peri)
+        return np.stack([np.stack([cn*cp - sn*ci*sp, -cn*sp - sn*ci*cp, sn*si], axis=-1),
+                         np.stack([sn*cp + cn*ci*sp, -sn*sp + cn*ci*cp, -cn*si], axis=-1),
+                         np.stack([si*sp, si*cp, ci], axis=-1)], axis=1)
+
+    def period(self):
+        return 2 * np.pi * np.sqrt(self.a**3 / (G * self.mass_star))
+
+    def update(self, time_scale=1.0):
+        self.t += self.dt * time_scale
 
     def reset(self):
         self.t = 0
-        self.theta = 0
-        
 
-    def get_positions(self):
-        return self.d*np.cos(self.theta), self.d*np.sqrt(1 - self.e**2)*np.sin(self.theta), 0
+    def _in_space(self, p, q):
+        # Orbital plane coordinates (p towards the periapsis) of shape (n, ...) to positions (n, ..., 3)
+        return p[..., np.newaxis] * self.rotation[:, np.newaxis, :, 0] + q[..., np.newaxis] * self.rotation[:, np.newaxis, :, 1]
 
-    def get_orbit(self):
-        theta = np.linspace(0, 2 * np.pi, 100)
-        x = self.d * np.cos(theta)
-        y = self.d * np.sqrt(1 - self.e**2) * np.sin(theta)
-        z = np.zeros_like(theta)
-        return x, y, z
-
-    
+    def positions(self, t=None):
+        """Positions of all bodies at time t (default the current time), shape (n, 3)"""
+        t = self.t if t is None else t
+        mean_motion = np.sqrt(G * self.mass_star / self.a**3)
+        E = solve_kepler(self.mean_anomaly + mean_motion * t, self.e)
+        p = self.a * (np.cos(E) - self.e)
+        q = self.a * np.sqrt(1 - self.e**2) * np.sin(E)
+        return self._in_space(p[:, np.newaxis], q[:, np.newaxis])[:, 0]
 
+    def outline(self, points=100):
+        """Closed orbit of every body, shape (n, points, 3), cached per element set"""
+        key = (points,) + self.outlines.key(self.a, self.e, self.i, self.node, self.peri)
+        return self.outlines.get_or_compute(key, lambda: (self._outline(points),))[0]
 
+    def _outline(self, points):
+        E = np.linspace(0, 2 * np.pi, points)
+        p = self.a[:, np.newaxis] * (np.cos(E) - self.e[:, np.newaxis])
+        q = (self.a * np.sqrt(1 - self.e**2))[:, np.newaxis] * np.sin(E)
+        return self._in_space(p, q)
 
 
-def plot_3d_orbit(max_t, mass_star, distance, eccentricity):
-    global x_path, y_path, z_path, planet_scatter
-    planet = Planet(mass_star, distance, eccentricity)
+def plot_3d_orbit(max_t, mass_star, distance, eccentricity, inclination=0.0):
+    planet = KeplerOrbits(mass_star, distance, eccentricity, inclination)
 
     fig = plt.figure()
     ax  = fig.add_subplot(projection='3d')
     
     ax.scatter(0, 0, 0, color="yellow", s=500)
-    x, y, z = planet.get_positions()
-    x_orbit, y_orbit, z_orbit = planet.get_orbit()
+    x_orbit, y_orbit, z_orbit = planet.outline()[0].T
 
-    planet_scatter = ax.scatter(x, y, z, color="blue")
+    # Persistent artists, only they are redrawn by the blitting animation
+    renderer = BodyRenderer(ax, planet.positions(), [36], ["blue"], trails=False)
     path_traveld, = ax.plot(x_orbit, y_orbit, z_orbit, color="blue", alpha=0.3)
+    renderer.add(path_traveld)
 
 
     ax.set_xlim(-15, 15)
@@ -65,53 +116,47 @@ def plot_3d_orbit(max_t, mass_star, distance, eccentricity):
     ax.set_xlabel("Distance (units)")
     ax.set_ylabel("Distance (units)")
     ax.set_zlabel("Distance (units)")
-    ax.set_title(f"Orbit t: {planet.t:.1f}, period: {(2 * np.pi * np.sqrt(planet.d**3) / (G*mass_star)):.2f}")
+    renderer.set_text(f"Orbit t: {planet.t:.1f}, period: {planet.period()[0]:.2f}")
     ax.set_box_aspect([1,1,1])
 
     # Add the animation
     def update_animation(frame):
-        global planet_scatter
         if planet.t >= max_t:
             planet.reset()
         else:
             planet.update()
 
-        planet_scatter.remove()
-        x, y, z = planet.get_positions()
-        planet_scatter = ax.scatter(x, y, z, color="blue")
-
-        ax.set_title(f"Orbit t: {planet.t:.1f}, period: {(2 * np.pi * np.sqrt(planet.d**3) / (G*planet.s_mass)):.2f}")
-        return planet_scatter
+        renderer.set_positions(planet.positions())
+        renderer.set_text(f"Orbit t: {planet.t:.1f}, period: {planet.period()[0]:.2f}")
+        return renderer.draw()
 
     
-    ani = FuncAnimation(fig, update_animation, frames=int(max_t/0.1))
+    ani = FuncAnimation(fig, update_animation, frames=int(max_t/planet.dt), blit=True)
 
     # Add the sliders
-    plt.subplots_adjust(bottom=0.25)
+    plt.subplots_adjust(bottom=0.3)
     m_slider_ax = plt.axes([0.2, 0.05, 0.6, 0.03])
     m_slider = Slider(ax=m_slider_ax, valmin=500, valmax=1500, valinit=mass_star, label="Star Mass")
     d_slider_ax = plt.axes([0.2, 0.1, 0.6, 0.03])
     d_slider = Slider(ax=d_slider_ax, valmin=5, valmax=15, valinit=distance, label="Distance")
     e_slider_ax = plt.axes([0.2, 0.15, 0.6, 0.03])
     e_slider = Slider(ax=e_slider_ax, valmin=0, valmax=0.9, valinit=eccentricity, label="eccentricity")
+    i_slider_ax = plt.axes([0.2, 0.2, 0.6, 0.03])
+    i_slider = Slider(ax=i_slider_ax, valmin=0, valmax=np.pi/2, valinit=inclination, label="inclination")
 
     def update_slider(val):
-        global planet_scatter
-        planet.d = d_slider.val
-        planet.e = e_slider.val
-        planet.s_mass = m_slider.val
-        planet.update()
+        planet.mass_star = m_slider.val
+        planet.set_elements(a=d_slider.val, e=e_slider.val, i=i_slider.val)
 
-        x_orbit, y_orbit, z_orbit = planet.get_orbit()
+        x_orbit, y_orbit, z_orbit = planet.outline()[0].T
         path_traveld.set_data_3d(x_orbit, y_orbit, z_orbit)
-
-        planet_scatter.remove()
-        x, y, z = planet.get_positions()
-        planet_scatter = ax.scatter(x, y, z, color="blue")
+        renderer.touch(path_traveld)
+        renderer.set_positions(planet.positions())
 
     d_slider.on_changed(update_slider)
     e_slider.on_changed(update_slider)
     m_slider.on_changed(update_slider)
+    i_slider.on_changed(update_slider)
     
 
 
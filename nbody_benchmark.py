@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import importlib.util
+import numpy as np
+
+SIZES = (3, 100, 1000, 10000, 100000)
+SOLVERS = ("direct", "barnes-hut", "parallel", "particle-mesh")
+INTEGRATORS = ("euler", "leapfrog", "yoshida4", "rk4", "block")  # block: adaptive block time step leapfrog
+ALL_PAIRS = ("direct", "parallel")  # O(n^2) solvers, skipped above max_direct bodies
+
+
+def load_simulation():
+    """The simulation module, whose file name is not a valid module name"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.insert(0, here)
+    spec = importlib.util.spec_from_file_location("nbody_simulation", os.path.join(here, "3d_n_body_simulation.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def plummer(n, seed=0):
+    """Masses, positions and velocities of a Plummer sphere with total mass 1 and scale radius 1 (G = 1)"""
+    rng = np.random.default_rng(seed)
+    masses = np.full(n, 1 / n)
+
+    # Radius from the inverse cumulative mass profile, in a random direction
+    radius = 1 / np.sqrt(rng.uniform(1e-3, 0.99, n)**(-2/3) - 1)
+    positions = radius[:, np.newaxis] * _directions(rng, n)
+
+    # Speed as a fraction q of the escape speed, by rejection sampling of q^2 (1 - q^2)^(7/2)
+    q = np.empty(n)
+    todo = np.arange(n)
+    while len(todo):
+        x, y = rng.uniform(0, 1, len(todo)), rng.uniform(0, 0.1, len(todo))
+        accepted = y < x**2 * (1 - x**2)**3.5
+        q[todo[accepted]] = x[accepted]
+        todo = todo[~accepted]
+    speed = q * np.sqrt(2) * (1 + radius**2)**(-1/4)
+    velocities = speed[:, np.newaxis] * _directions(rng, n)
+
+    # Centre of mass at rest in the origin
+    positions -= positions.mean(axis=0)
+    velocities -= velocities.mean(axis=0)
+    return masses, positions, velocities
+
+
+def _directions(rng, n):
+    v = rng.normal(size=(n, 3))
+    return v / np.linalg.norm(v, axis=1)[:, np.newaxis]
+
+
+def cases(sizes=SIZES, solvers=SOLVERS, integrators=INTEGRATORS, max_direct=20000):
+    """Every (solver, integrator, n) combination of the suite"""
+    for n in sizes:
+        for solver in solvers:
+            if solver in ALL_PAIRS and n > max_direct:
+                continue
+            for integrator in integrators:
+                yield solver, integrator, n
+
+
+def case_key(result):
+    return f"{result['solver']}/{result['integrator']}/{result['n']}"
+
+
+def run_case(sim, solver, integrator, n, budget=10.0, max_steps=100, repeats=3, seed=0):
+    """Time one configuration over `max_steps` steps, or fewer when they take longer than `budget` seconds.
+
+    The steps are timed `repeats` times from the initial state and the best
+    time is kept, unless the first run already hit the budget. Peak memory
+    is the largest traced allocation of this process while the system is
+    built and takes its first steps, in a separate pass, since tracing
+    slows the timed steps down; the memory of the parallel workers is not
+    included. The energy drift is exact: the energy is evaluated afresh at
+    the end of the best run, outside of the timed steps.
+    """
+    masses, positions, velocities = plummer(n, seed)
+    system = None
+    try:
+        tracemalloc.start()
+        try:
+            system = sim.NbodySystem(n, masses, positions, velocities, solver=solver,
+                                     integrator="leapfrog" if integrator == "block" else integrator,
+                                     adaptive=integrator == "block")
+            system.update()  # Buffers, trees and the worker pool are set up in the first step
+            system.update()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        best = None
+        for repeat in range(repeats):
+            system.reset()
+            system.update()  # Warm-up
+            evaluations = system.force_evaluations
+            steps = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while steps < max_steps and (steps == 0 or elapsed < budget):
+                system.update()
+                steps += 1
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed / steps < best[0] / best[1]:
+                # Everything reported comes from this one run, the energy is taken before the solver is closed
+                system.clear_cache()
+                best = (elapsed, steps, system.force_evaluations - evaluations, system.get_energy(), system.time)
+            if steps < max_steps:
+                break
+        elapsed, steps, evaluations, energy, simulated = best
+    finally:
+        if system is not None and hasattr(system.kernel, "close"):
+            system.kernel.close()
+
+    return {"solver": solver, "integrator": integrator, "n": n, "steps": steps, "seconds": elapsed,
+            "steps_per_second": steps / elapsed,
+            "force_evaluations_per_second": evaluations / elapsed,
+            "peak_memory_bytes": peak,
+            "energy_drift": float(abs((energy - system.e0) / system.e0)),
+            "simulated_time": float(simulated)}
+
+
+def benchmark(sizes=SIZES, solvers=SOLVERS, integrators=INTEGRATORS, max_direct=20000,
+              budget=10.0, max_steps=100, repeats=3, seed=0, log=None):
+    """Run the suite, returns the results with a description of the machine"""
+    sim = load_simulation()
+    results = []
+    for solver, integrator, n in cases(sizes, solvers, integrators, max_direct):
+        try:
+            result = run_case(sim, solver, integrator, n, budget, max_steps, repeats, seed)
+        except Exception as error:  # A failing case should not end the whole suite
+            result = {"solver": solver, "integrator": integrator, "n": n, "error": repr(error)}
+        results.append(result)
+        if log is not None:
+            log(format_result(result))
+
+    return {"machine": {"python": platform.python_version(), "numpy": np.__version__,
+                        "platform": platform.platform(), "processor": platform.processor(),
+                        "cpus": os.cpu_count()},
+            "settings": {"budget": budget, "max_steps": max_steps, "repeats": repeats, "seed": seed, "max_direct": max_direct},
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": results}
+
+
+def format_result(result):
+    if "error" in result:
+        return f"{case_key(result):32s} failed: {result['error']}"
+    return (f"{case_key(result):32s} {result['steps_per_second']:10.2f} steps/s "
+            f"{result['force_evaluations_per_second']:12.4g} evals/s "
+            f"{result['peak_memory_bytes'] / 2**20:9.1f} MiB  drift {result['energy_drift']:.2e}")
+
+
+def compare(results, baseline, tolerance=0.2, drift_factor=10.0):
+    """Regressions of results against a baseline, as human readable lines.
+
+    A case regresses when its throughput drops or its peak memory grows by
+    more than `tolerance`, when its energy drift grows by more than
+    `drift_factor`, or when it fails while the baseline did not. The drift
+    is only compared between runs of the same number of steps. Cases that
+    are missing on either side are not compared.
+    """
+    reference = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        key = case_key(result)
+        old = reference.get(key)
+        if old is None or "error" in old:
+            continue
+        if "error" in result:
+            regressions.append(f"{key}: failed, {result['error']}")
+            continue
+        for metric in ("steps_per_second", "force_evaluations_per_second"):
+            if result[metric] < (1 - tolerance) * old[metric]:
+                regressions.append(f"{key}: {metric} {result[metric]:.4g} < {old[metric]:.4g}")
+        if result["peak_memory_bytes"] > (1 + tolerance) * old["peak_memory_bytes"]:
+            regressions.append(f"{key}: peak_memory_bytes {result['peak_memory_bytes']} > {old['peak_memory_bytes']}")
+        # Drift below 1e-12 is round-off, do not compare it
+        if result["steps"] == old["steps"] and result["energy_drift"] > drift_factor * max(old["energy_drift"], 1e-12):
+            regressions.append(f"{key}: energy_drift {result['energy_drift']:.3g} > {old['energy_drift']:.3g}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NbodySystem across body counts, solvers and integrators")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--solvers", nargs="+", default=SOLVERS, choices=SOLVERS)
+    parser.add_argument("--integrators", nargs="+", default=INTEGRATORS, choices=INTEGRATORS)
+    parser.add_argument("--max-direct", type=int, default=20000, help="largest n for the all-pairs solvers")
+    parser.add_argument("--budget", type=float, default=10.0, help="at most this many seconds of steps per case")
+    parser.add_argument("--max-steps", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3, help="timings per case, the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="nbody_benchmark.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative loss of throughput or memory")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.sizes, args.solvers, args.integrators, args.max_direct,
+                        args.budget, args.max_steps, args.repeats, args.seed, log=print)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import numpy as np
+
+
+def softened_weights(diff, masses, epsilon, dist, tmp, potential=None):
+    """Softened gravity weights of the pairs whose separations are in diff, in place.
+
+    diff has shape (3, ...) and dist, tmp and potential the shape of one
+    component; masses are the source masses, broadcast against dist. On
+    return dist holds m / (|r| + epsilon)^3, the weight of the separation in
+    the acceleration, and potential (when given) m (|r| + epsilon/2) / (|r| + epsilon)^2.
+    Without softening both vanish for coincident bodies.
+    """
+    np.multiply(diff[0], diff[0], out=dist)
+    for k in (1, 2):
+        np.multiply(diff[k], diff[k], out=tmp)
+        dist += tmp
+    np.sqrt(dist, out=dist)
+    dist += epsilon
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.reciprocal(dist, out=tmp)
+        if potential is not None:
+            np.subtract(dist, epsilon / 2, out=potential)
+            potential *= tmp
+            potential *= tmp
+            potential *= masses
+        np.multiply(tmp, tmp, out=dist)
+        dist *= tmp
+        dist *= masses
+    if epsilon <= 0:
+        dist[~np.isfinite(dist)] = 0  # Self-interaction without softening
+        if potential is not None:
+            potential[~np.isfinite(potential)] = 0
+    return dist
+
+
+def finish_potential(potential, masses, G, epsilon):
+    # Remove the self term m_i / (2 epsilon) picked up at r_ii = 0, and scale to -G sum
+    if epsilon > 0:
+        potential -= masses / (2 * epsilon)
+    potential *= -G
+
+
+class TiledKernel():
+    """Direct all-pairs softened gravity, evaluated in row tiles.
+
+    The pairwise differences are never materialised for the whole system at
+    once: the rows are processed in tiles of at most `tile_pairs` pairs, so
+    memory stays bounded at large n. The scratch buffers are kept between
+    calls; when the number of bodies changes they are re-viewed, and only
+    reallocated when they have to grow.
+    """
+    def __init__(self, tile_pairs=2**14):
+        if tile_pairs < 1:
+            raise ValueError(f"tile_pairs should be >= 1, {tile_pairs} was given")
+        self.tile_pairs = tile_pairs
+        self.n = 0
+        self.rows = 0
+        self.capacity = 0   # Pairs per tile that the flat buffers can hold
+        self._flat_pos = np.empty(0)
+        self._flat_pot = None
+
+    def _allocate(self, n):
+        # Enough rows per tile to fill the pair budget, but at least one
+        self.n = n
+        self.rows = max(1, min(n, self.tile_pairs // max(n, 1)))
+        if self.rows * n > self.capacity:
+            self.capacity = max(self.tile_pairs, n)
+            self._flat_diff = np.empty(3 * self.capacity)
+            self._flat_dist = np.empty(self.capacity)
+            self._flat_tmp = np.empty(self.capacity)
+            self._flat_pot = None
+        if 3 * n > len(self._flat_pos):
+            self._flat_pos = np.empty(3 * n)
+
+        pairs = self.rows * n
+        self._pos = self._flat_pos[:3 * n].reshape(3, n)              # Component-major copy of the positions
+        self._diff = self._flat_diff[:3 * pairs].reshape(3, self.rows, n)   # x_j - x_i per component
+        self._dist = self._flat_dist[:pairs].reshape(self.rows, n)
+        self._tmp = self._flat_tmp[:pairs].reshape(self.rows, n)
+        self._pot = None if self._flat_pot is None else self._flat_pot[:pairs].reshape(self.rows, n)
+
+    def accelerations(self, positions, masses, G, epsilon, targets=None, out=None, potential=None):
+        """Acceleration of the target bodies (all bodies by default) due to all bodies.
+
+        When a `potential` array is given, the potential -G sum_j m_j (r + eps/2) / (r + eps)^2
+        that every target body feels is written into it as a by-product.
+        """
+        n = len(positions)
+        if n != self.n:
+            self._allocate(n)
+
+        pos = self._pos
+        pos[...] = positions.T
+        rows = pos if targets is None else pos[:, targets]
+        n_rows = rows.shape[1]
+        if out is None:
+            out = np.empty((n_rows, 3))
+        if potential is not None and self._pot is None:
+            self._flat_pot = np.empty(self.capacity)
+            self._pot = self._flat_pot[:self.rows * n].reshape(self.rows, n)
+
+        for start in range(0, n_rows, self.rows):
+            stop = min(start + self.rows, n_rows)
+            diff = self._diff[:, :stop - start]
+            dist = self._dist[:stop - start]
+            tmp = self._tmp[:stop - start]
+
+            np.subtract(pos[:, np.newaxis, :], rows[:, start:stop, np.newaxis], out=diff)
+            pot = None if potential is None else self._pot[:stop - start]
+            softened_weights(diff, masses, epsilon, dist, tmp, pot)
+            if potential is not None:
+                pot.sum(axis=1, out=potential[start:stop])
+
+            # Sum over j, the self term vanishes on its own since r_ii = 0
+            out[start:stop] = np.matmul(diff.transpose(1, 0, 2), dist[:, :, np.newaxis])[:, :, 0]
+
+        out *= G
+        if potential is not None:
+            finish_potential(potential, masses if targets is None else masses[targets], G, epsilon)
+        return out
+
+
+class BatchedKernel():
+    """Direct all-pairs softened gravity for a batch of independent systems.
+
+    Positions have shape (B, n, 3) and the B systems never interact. The
+    members are processed in tiles of at most `tile_pairs` pairs, with
+    scratch buffers that are kept between calls, so one call evaluates the
+    forces of the whole ensemble with a handful of NumPy operations.
+    """
+    def __init__(self, tile_pairs=2**16):
+        if tile_pairs < 1:
+            raise ValueError(f"tile_pairs should be >= 1, {tile_pairs} was given")
+        self.tile_pairs = tile_pairs
+        self.shape = None
+
+    def _allocate(self, shape):
+        b, n = shape[:2]
+        self.shape = shape
+        self.members = max(1, min(b, self.tile_pairs // max(n*n, 1)))
+        self._pos = np.empty((3, b, n))
+        self._diff = np.empty((3, self.members, n, n))   # x_j - x_i per component
+        self._dist = np.empty((self.members, n, n))
+        self._tmp = np.empty((self.members, n, n))
+        self._pot = None
+
+    def accelerations(self, positions, masses, G, epsilon, out=None, potential=None):
+        """Acceleration, shape (B, n, 3), of every body of every member.
+
+        masses has shape (B, n) or (n,). When a `potential` array of shape
+        (B, n) is given, the potential every body feels is written into it.
+        """
+        if positions.shape != self.shape:
+            self._allocate(positions.shape)
+        b, n = positions.shape[:2]
+        masses = np.broadcast_to(masses, (b, n))
+
+        pos = self._pos
+        pos[...] = np.moveaxis(positions, -1, 0)
+        if out is None:
+            out = np.empty((b, n, 3))
+        if potential is not None and self._pot is None:
+            self._pot = np.empty(self._dist.shape)
+
+        for start in range(0, b, self.members):
+            stop = min(start + self.members, b)
+            diff = self._diff[:, :stop - start]
+            dist = self._dist[:stop - start]
+            tmp = self._tmp[:stop - start]
+            m = masses[start:stop, np.newaxis, :]
+
+            np.subtract(pos[:, start:stop, np.newaxis, :], pos[:, start:stop, :, np.newaxis], out=diff)
+            pot = None if potential is None else self._pot[:stop - start]
+            softened_weights(diff, m, epsilon, dist, tmp, pot)
+            if potential is not None:
+                pot.sum(axis=2, out=potential[start:stop])
+
+            # Sum over j, the self term vanishes on its own since r_ii = 0
+            out[start:stop] = np.matmul(diff.transpose(1, 2, 0, 3), dist[..., np.newaxis])[..., 0]
+
+        out *= G
+        if potential is not None:
+            finish_potential(potential, masses, G, epsilon)
+        return out
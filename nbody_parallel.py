@@ -0,0 +1,185 @@
+import os
+import time
+import weakref
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from nbody_kernels import TiledKernel
+
+
+def _views(buf, n):
+    """Positions, masses, accelerations, potentials, targets and parameters inside the shared block"""
+    pos = np.ndarray((n, 3), dtype="float64", buffer=buf)
+    masses = np.ndarray((n,), dtype="float64", buffer=buf, offset=8*3*n)
+    acc = np.ndarray((n, 3), dtype="float64", buffer=buf, offset=8*4*n)
+    phi = np.ndarray((n,), dtype="float64", buffer=buf, offset=8*7*n)
+    targets = np.ndarray((n,), dtype="int64", buffer=buf, offset=8*8*n)
+    # G, epsilon, number of targets (-1 for all bodies), potential flag, bodies in use
+    params = np.ndarray((5,), dtype="float64", buffer=buf, offset=8*9*n)
+    return pos, masses, acc, phi, targets, params
+
+
+def _shared_size(n):
+    return 8 * (9*n + 5)
+
+
+def _worker(name, capacity, index, workers, connection, tile_pairs):
+    # Every worker owns the index-th block of the rows that are requested
+    shm = SharedMemory(name=name)
+    pos, masses, acc, phi, targets, params = _views(shm.buf, capacity)
+    try:
+        kernel = TiledKernel(tile_pairs)
+        while connection.recv():  # True starts a step, False stops
+            G, eps, n_targets, with_potential, n = params
+            n = int(n)
+
+            count = n if n_targets < 0 else int(n_targets)
+            lo = index * count // workers
+            hi = (index + 1) * count // workers
+            if hi > lo:
+                rows = slice(lo, hi) if n_targets < 0 else targets[lo:hi]
+                kernel.accelerations(pos[:n], masses[:n], G, eps, targets=rows, out=acc[lo:hi],
+                                     potential=phi[lo:hi] if with_potential else None)
+            connection.send(None)
+    except EOFError:
+        pass  # The parent is gone
+    except Exception as error:
+        connection.send(repr(error))  # Report instead of leaving the parent waiting
+    finally:
+        del pos, masses, acc, phi, targets, params
+        shm.close()
+
+
+def _shutdown(shm, connections, processes, timeout):
+    for connection in connections:
+        try:
+            connection.send(False)
+        except OSError:
+            pass  # That worker is already gone
+
+    # One deadline for the whole pool, then the workers still running are stopped
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for process in processes:
+        process.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(1.0)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    for connection in connections:
+        connection.close()
+    shm.close()
+    shm.unlink()
+
+
+class ParallelSolver():
+    """Direct all-pairs gravity split over a persistent pool of worker processes.
+
+    Positions, masses and accelerations live in one shared memory block, so
+    nothing but a start and a done message is pickled per step: the parent
+    copies the positions in, tells every worker to start, and waits until
+    every worker has written its disjoint block of rows. The pool is started
+    on the first call and restarted only when the number of bodies grows
+    beyond the capacity of the shared block, so bodies can be removed between
+    steps. When a worker raises, dies, or a step takes longer than `timeout`
+    seconds (None waits forever), the pool is shut down and a RuntimeError
+    is raised.
+    """
+    def __init__(self, workers=None, tile_pairs=2**14, timeout=600.0):
+        if workers is not None and workers < 1:
+            raise ValueError(f"workers should be >= 1, {workers} was given")
+        self.workers = os.cpu_count() if workers is None else workers
+        self.tile_pairs = tile_pairs
+        self.timeout = timeout
+        self.capacity = 0
+        self._finalizer = None
+
+    def _start(self, n):
+        self.close()
+        ctx = mp.get_context()
+        self.capacity = n
+        self._shm = SharedMemory(create=True, size=_shared_size(n))
+        self._pos, self._masses, self._acc, self._phi, self._targets, self._params = _views(self._shm.buf, n)
+
+        pipes = [ctx.Pipe() for _ in range(self.workers)]
+        processes = [ctx.Process(target=_worker, args=(self._shm.name, n, i, self.workers, pipes[i][1], self.tile_pairs),
+                                 daemon=True) for i in range(self.workers)]
+        for process in processes:
+            process.start()
+        for _, child in pipes:
+            child.close()
+        self._connections = [parent for parent, _ in pipes]
+        self._processes = processes
+
+        # Shuts the pool down when the solver is closed or garbage collected
+        self._finalizer = weakref.finalize(self, _shutdown, self._shm, self._connections, processes, self.timeout)
+
+    def close(self):
+        """Stop the worker processes and release the shared memory"""
+        if self._finalizer is not None:
+            del self._pos, self._masses, self._acc, self._phi, self._targets, self._params
+            self._finalizer()
+            self._finalizer = None
+            self.capacity = 0
+
+    def _step(self):
+        # Start every worker, then wait for all of them, a dead worker's sentinel ends the wait
+        for connection in self._connections:
+            connection.send(True)
+        pending = set(self._connections)
+        sentinels = {process.sentinel: process for process in self._processes}
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while pending:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready = wait([*pending, *sentinels], remaining)
+            if not ready:
+                self._fail(f"the force workers did not finish a step within {self.timeout} s")
+            for item in ready:
+                if item in pending:
+                    try:
+                        error = item.recv()
+                    except EOFError:
+                        error = "exited"
+                    if error is not None:
+                        self._fail(f"a force worker failed: {error}")
+                    pending.discard(item)
+            for item in ready:
+                if item in sentinels and pending:
+                    process = sentinels[item]
+                    self._fail(f"a force worker died with exit code {process.exitcode}")
+
+    def _fail(self, message):
+        # A failed pool gets no grace period, waiting on a hung worker would only delay the error
+        for process in self._processes:
+            process.terminate()
+        self.close()
+        raise RuntimeError(message)
+
+    def accelerations(self, positions, masses, G, epsilon, targets=None, out=None, potential=None):
+        """Acceleration (and optionally potential) of the target bodies (all by default) due to all bodies"""
+        n = len(positions)
+        if n > self.capacity:
+            self._start(n)
+
+        self._pos[:n] = positions
+        self._masses[:n] = masses
+        if targets is None:
+            n_targets = -1
+            count = n
+        else:
+            targets = np.arange(n)[targets]
+            count = n_targets = len(targets)
+            self._targets[:count] = targets
+        self._params[:] = (G, epsilon, n_targets, potential is not None, n)
+        self._step()
+
+        if out is None:
+            out = np.empty((count, 3))
+        out[...] = self._acc[:count]
+        if potential is not None:
+            potential[...] = self._phi[:count]
+        return out
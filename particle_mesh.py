@@ -0,0 +1,123 @@
+import numpy as np
+
+CORNERS = [(dx, dy, dz) for dx in (0, 1) for dy in (0, 1) for dz in (0, 1)]
+
+
+class ParticleMeshSolver():
+    """Particle-mesh gravity: O(N + M log M) for N bodies on a grid of M cells.
+
+    The masses are deposited on a grid with cloud-in-cell weights, Poisson's
+    equation is solved with FFTs, the potential is differentiated with
+    central differences and the accelerations are interpolated back to the
+    bodies with the same cloud-in-cell weights.
+
+    With periodic=True the box [origin, origin + box_size)^3 wraps around and
+    the cell size h = box_size / grid sets the force resolution; the mean
+    density does not act on the bodies. If box_size is not given it is fixed
+    on the first call to a cube 10% larger than the bodies' bounding box.
+    With periodic=False the grid follows the bodies, is zero-padded to twice
+    its size and is convolved with the softened pair potential of the direct
+    kernel, -(r + eps/2) / (r + eps)^2, so there are no periodic images.
+
+    The potential handed out includes the self-energy of every body's cloud.
+    """
+    def __init__(self, grid=64, box_size=None, origin=0.0, periodic=True):
+        if grid < 2:
+            raise ValueError(f"grid should be >= 2, {grid} was given")
+        self.grid = grid
+        self.box_size = box_size
+        self.origin = np.broadcast_to(np.asarray(origin, dtype="float64"), (3,))
+        self.periodic = periodic
+        self._green = None
+        self._green_key = None
+
+    def accelerations(self, positions, masses, G, epsilon, targets=None, out=None, potential=None):
+        """Acceleration of the target bodies (all bodies by default) due to all bodies"""
+        if self.periodic:
+            if self.box_size is None:
+                lo, hi = positions.min(axis=0), positions.max(axis=0)
+                self.box_size = 1.1 * max((hi - lo).max(), 1e-12)
+                self.origin = (lo + hi) / 2 - self.box_size / 2
+            h = self.box_size / self.grid
+            origin = self.origin
+            shape = (self.grid,) * 3
+        else:
+            # Power-of-two cell sizes, so the Green's function can be reused while the bodies move
+            origin = positions.min(axis=0)
+            extent = max((positions.max(axis=0) - origin).max(), 1e-12)
+            h = 2.0**np.ceil(np.log2(extent * (1 + 1e-9) / (self.grid - 1)))
+            shape = (2 * self.grid,) * 3
+
+        cells = (positions - origin) / h
+        grid_mass = self.deposit(cells, masses, shape)
+        if self.periodic:
+            phi = self._periodic_potential(grid_mass / h**3, h, G)
+        else:
+            phi = self._isolated_potential(grid_mass, h, G, epsilon)
+
+        # Acceleration on the grid, -grad phi
+        grid_acc = [-(np.roll(phi, -1, axis) - np.roll(phi, 1, axis)) / (2 * h) for axis in range(3)]
+
+        points = cells if targets is None else cells[targets]
+        if out is None:
+            out = np.empty((len(points), 3))
+        for axis in range(3):
+            out[:, axis] = self.interpolate(grid_acc[axis], points)
+        if potential is not None:
+            potential[...] = self.interpolate(phi, points)
+        return out
+
+    @staticmethod
+    def _weights(cells, shape):
+        # Flat indices and cloud-in-cell weights of the 8 cells around every point
+        base = np.floor(cells).astype(np.int64)
+        frac = cells - base
+        for corner in CORNERS:
+            index = np.zeros(len(cells), dtype=np.int64)
+            weight = np.ones(len(cells))
+            for axis, d in enumerate(corner):
+                index = index * shape[axis] + (base[:, axis] + d) % shape[axis]
+                weight *= frac[:, axis] if d else 1 - frac[:, axis]
+            yield index, weight
+
+    def deposit(self, cells, masses, shape):
+        """Cloud-in-cell mass per grid cell, for positions in cell units"""
+        size = shape[0] * shape[1] * shape[2]
+        grid = np.zeros(size)
+        for index, weight in self._weights(cells, shape):
+            grid += np.bincount(index, weights=weight * masses, minlength=size)
+        return grid.reshape(shape)
+
+    def interpolate(self, grid, cells):
+        """Cloud-in-cell interpolation of a grid quantity at positions in cell units"""
+        flat = grid.ravel()
+        values = np.zeros(len(cells))
+        for index, weight in self._weights(cells, grid.shape):
+            values += weight * flat[index]
+        return values
+
+    def _periodic_potential(self, density, h, G):
+        # Solve laplacian(phi) = 4 pi G rho in Fourier space
+        n = density.shape[0]
+        k = 2 * np.pi * np.fft.fftfreq(n, d=h)
+        kz = 2 * np.pi * np.fft.rfftfreq(n, d=h)
+        k2 = k[:, None, None]**2 + k[None, :, None]**2 + kz[None, None, :]**2
+        k2[0, 0, 0] = 1.0
+
+        phi_k = -4 * np.pi * G * np.fft.rfftn(density) / k2
+        phi_k[0, 0, 0] = 0.0  # The mean density does not act
+        return np.fft.irfftn(phi_k, s=density.shape)
+
+    def _isolated_potential(self, grid_mass, h, G, epsilon):
+        # Convolve the masses with the pair potential on the zero-padded grid
+        key = (grid_mass.shape, h, epsilon)
+        if key != self._green_key:
+            n = grid_mass.shape[0]
+            d = np.minimum(np.arange(n), n - np.arange(n)) * h
+            r = np.sqrt(d[:, None, None]**2 + d[None, :, None]**2 + d[None, None, :]**2)
+            if epsilon <= 0:
+                r[0, 0, 0] = h / 2  # Without softening the own cell counts at half a cell
+            green = -(r + epsilon / 2) / (r + epsilon)**2
+            self._green = np.fft.rfftn(green)
+            self._green_key = key
+        return G * np.fft.irfftn(np.fft.rfftn(grid_mass) * self._green, s=grid_mass.shape)
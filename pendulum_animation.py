@@ -2,22 +2,23 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Slider
 import numpy as np
+from frame_stream import ReadAhead
 
 def plot_pendulum_motion(max_t, length, gravity, initial_angle):
-    global x, y, ani, period
+    global stream, ani, period
 
+    # Frames are pulled lazily from the simulation, a few at a time
     period = 2*np.pi*np.sqrt(length/gravity)
-    data = list(pendulum_motion(max_t, length, gravity, initial_angle))
-    t = [i[0] for i in data]
-    x = [i[1] for i in data]
-    y = [i[2] for i in data]
+    stream = ReadAhead(pendulum_motion(max_t, length, gravity, initial_angle))
+    parameters = [length, gravity, initial_angle]
+    t, x, y, _ = next(pendulum_motion(max_t, length, gravity, initial_angle))
 
 
     fig, ax = plt.subplots(figsize=(8,8))
     
     plt.scatter([0], [0], color="blue", s=100)
-    pendulum = plt.scatter([x[0]], [y[0]], color="red", s=200)
-    line, = plt.plot([0, x[0]], [0, y[0]], linestyle="-", color="red")
+    pendulum = plt.scatter([x], [y], color="red", s=200)
+    line, = plt.plot([0, x], [0, y], linestyle="-", color="red")
 
     ax.set_xlim(-3, 3)
     ax.set_ylim(-3.3, 0)
@@ -27,13 +28,21 @@ def plot_pendulum_motion(max_t, length, gravity, initial_angle):
 
     # Add the animation
     def update_animation(frame):
-        ax.set_title(f"Pendulum: t = {t[frame]:.2f}, period = {period:.1f}")
-        pendulum.set_offsets(np.c_[x[frame], y[frame]])
-        line.set_xdata([0, x[frame]])
-        line.set_ydata([0, y[frame]])
+        global stream
+        data = next(stream, None)
+        if data is None:
+            # Past max_t, start over like a repeating animation
+            stream = ReadAhead(pendulum_motion(max_t, *parameters))
+            data = next(stream)
+        t, x, y, _ = data
+
+        ax.set_title(f"Pendulum: t = {t:.2f}, period = {period:.1f}")
+        pendulum.set_offsets(np.c_[x, y])
+        line.set_xdata([0, x])
+        line.set_ydata([0, y])
         return pendulum, line
 
-    ani = FuncAnimation(fig, update_animation, frames=range(len(x)), interval=50)
+    ani = FuncAnimation(fig, update_animation, interval=50, cache_frame_data=False)
 
     # Add the Slider
     plt.subplots_adjust(bottom=.25)
@@ -46,16 +55,11 @@ def plot_pendulum_motion(max_t, length, gravity, initial_angle):
     a_slider = Slider(ax=a_slider_ax, label="initial angle", valmin=-1, valmax=1, valinit=initial_angle)
 
     def update_slider(val):
-        global t, x, y, ani, period
+        # A new lazy stream, the running animation picks it up at its next frame
+        global stream, period
         period = 2*np.pi*np.sqrt(l_slider.val/g_slider.val)
-        data = list(pendulum_motion(max_t, l_slider.val, g_slider.val, a_slider.val))
-        t = [i[0] for i in data]
-        x = [i[1] for i in data]
-        y = [i[2] for i in data]
-
-        ani.event_source.stop()
-        ani = FuncAnimation(fig, update_animation, frames=range(len(x)), interval=50)
-        fig.canvas.draw_idle()
+        parameters[:] = [l_slider.val, g_slider.val, a_slider.val]
+        stream = ReadAhead(pendulum_motion(max_t, *parameters))
 
     l_slider.on_changed(update_slider)
     g_slider.on_changed(update_slider)
@@ -86,5 +90,75 @@ def pendulum_motion(max_t, length, gravity, initial_angle):
 
 
 
+def sweep_pendulums(max_t, length, gravity, initial_angle, dt=0.05, trajectories=False):
+    """Simulate a whole grid of pendulums in lock-step, with the same steps as pendulum_motion.
+
+    length, gravity and initial_angle are broadcast against each other, e.g.
+    angles[:, None] and lengths[None, :] give a (angles, lengths) map. Every
+    pendulum starts at rest, so it turns around every half period: the period
+    is measured from the times at which the angular velocity changes sign,
+    interpolated between steps, and is NaN if it never turns around within
+    max_t. Returns a dict with the arrays 'period' and 'max_speed' (largest
+    speed of the bob), and with trajectories=True also 't' of shape (steps,)
+    and 'theta' of shape (steps, *grid shape).
+    """
+    length, gravity, theta = np.broadcast_arrays(*(np.asarray(v, dtype="float64") for v in
+                                                   (length, gravity, initial_angle)))
+    shape = theta.shape
+    k = (gravity / length).ravel()
+    theta = theta.ravel().copy()
+    omega = np.zeros_like(theta)
+    previous = np.zeros_like(theta)
+    acc = np.empty_like(theta)
+
+    # The same time steps as pendulum_motion, rounding included
+    times = [0]
+    while times[-1] + dt <= max_t:
+        times.append(times[-1] + dt)
+    steps = len(times)
+    first = np.full(theta.shape, np.nan)  # Time of the first turn
+    last = np.full(theta.shape, np.nan)   # Time of the last turn
+    turns = np.zeros(theta.shape, dtype=np.int64)
+    max_omega = np.zeros_like(theta)
+    history = np.empty((steps, theta.size)) if trajectories else None
+
+    for step in range(steps):
+        if trajectories:
+            history[step] = theta
+        if step == steps - 1:
+            break
+
+        # Semi-implicit Euler, like pendulum_motion
+        previous[...] = omega
+        np.sin(theta, out=acc)
+        acc *= k
+        acc *= dt
+        omega -= acc
+        np.multiply(omega, dt, out=acc)
+        theta += acc
+        np.maximum(max_omega, np.abs(omega), out=max_omega)
+
+        # omega at the step times crossed zero: the pendulum turned around
+        turned = np.flatnonzero(previous * omega < 0)
+        if len(turned):
+            w0, w1 = previous[turned], omega[turned]
+            t_turn = times[step] + dt * w0 / (w0 - w1)
+            first[turned] = np.where(turns[turned] == 0, t_turn, first[turned])
+            last[turned] = t_turn
+            turns[turned] += 1
+
+    # Two turns per period; with a single turn, the start at rest counts as one
+    with np.errstate(divide="ignore", invalid="ignore"):
+        period = np.where(turns > 1, 2 * (last - first) / (turns - 1), 2 * first)
+
+    result = {"period": period.reshape(shape), "max_speed": (max_omega * length.ravel()).reshape(shape)}
+    if trajectories:
+        result["t"] = np.array(times)
+        result["theta"] = history.reshape(steps, *shape)
+    return result
+
+
+
+
 if __name__ == "__main__":
     plot_pendulum_motion(10, 1.0, 9.8, 0.5)
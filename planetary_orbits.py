@@ -2,15 +2,16 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Slider
+from background_worker import LatestOnlyWorker
 
 
 def plot_planetary_orbits(max_t, mass_planet, mass_star, distance, eccentricity):
-    data = list(get_planet_positions(max_t, mass_planet, mass_star, distance, eccentricity))
-    global x, y, ani, period
-    x = [i[0] for i in data]
-    y = [i[1] for i in data]
-    t = [i[2] for i in data]
-    period = 2*np.pi*np.sqrt(distance**3 / mass_star)
+    # The orbit (x, y, t, period) is only ever replaced as a whole
+    global ani, orbit
+    orbit = compute_orbit(max_t, mass_planet, mass_star, distance, eccentricity)
+
+    # Slider changes are computed on a background thread, only the latest one counts
+    worker = LatestOnlyWorker(compute_orbit)
 
 
     fig, ax = plt.subplots(figsize=(8,8))
@@ -20,15 +21,22 @@ def plot_planetary_orbits(max_t, mass_planet, mass_star, distance, eccentricity)
     ax.grid(True)
 
     plt.scatter([0], [0], color="yellow", label="Star", s=200)
-    planet = ax.scatter([x[0]], [y[0]], s=50, c="blue", label="Planet")
+    planet = ax.scatter([orbit[0][0]], [orbit[1][0]], s=50, c="blue", label="Planet")
 
 
     def update_animation(frame):
+        global orbit
+        new_orbit = worker.take()
+        if new_orbit is not None:
+            orbit = new_orbit  # Swap in the finished recomputation
+        x, y, t, period = orbit
+        frame = frame % len(t)
+
         ax.set_title(f"Planet around Star: t = {t[frame]:.2f}, period: {period:.1f}")
         planet.set_offsets(np.c_[x[frame], y[frame]])
         return planet,
 
-    ani = FuncAnimation(fig, update_animation, frames=range(len(x)), interval=50)
+    ani = FuncAnimation(fig, update_animation, frames=range(len(orbit[2])), interval=50)
 
     # Add the sliders
     plt.subplots_adjust(bottom=0.25)
@@ -42,18 +50,11 @@ def plot_planetary_orbits(max_t, mass_planet, mass_star, distance, eccentricity)
 
 
     def update_slider(val):
-        global ani, data, x, y, period # Reset animation
-        period = 2*np.pi*np.sqrt(d_slider.val**3 / m_slider.val) 
-        data = list(get_planet_positions(max_t, mass_planet, m_slider.val, d_slider.val, e_slider.val))
-        
-        x = [i[0] for i in data]
-        y = [i[1] for i in data]
-        ani.event_source.stop()
-        ani = FuncAnimation(fig, update_animation, frames=range(len(x)))
-        fig.canvas.draw_idle()
-
+        # Never blocks, the animation keeps running on the old orbit until the new one is ready
+        worker.submit(max_t, mass_planet, m_slider.val, d_slider.val, e_slider.val)
 
 
+    fig.canvas.mpl_connect("close_event", lambda event: worker.close())
     e_slider.on_changed(update_slider)
     d_slider.on_changed(update_slider)
     m_slider.on_changed(update_slider)
@@ -64,12 +65,44 @@ def plot_planetary_orbits(max_t, mass_planet, mass_star, distance, eccentricity)
 
 
 
-def get_planet_positions(max_t, mass_planet, mass_star, distance, eccentricity):
+def get_planet_positions(max_t, mass_planet, mass_star, distance, eccentricity, method="euler", dt=0.1):
     """"Generate the star position, we assume during the orbit the position of the
-    star remains the same ea. the mass_star >>>> mass_planet."""
-    
-    t = 0
+    star remains the same ea. the mass_star >>>> mass_planet.
+
+    method="euler" returns a generator of (x, y, t) that integrates the orbit
+    step by step. method="kepler" solves Kepler's equation for all times at
+    once and returns the exact orbit as three arrays x, y and t."""
+    if method == "kepler":
+        t = np.arange(int(np.floor(max_t / dt + 1e-9)) + 1) * dt
+        x, y = kepler_positions(t, mass_star, distance, eccentricity)
+        return x, y, t
+    if method != "euler":
+        raise ValueError(f"method should be 'euler' or 'kepler', {method} was given")
+    return euler_positions(max_t, mass_star, distance, eccentricity, dt)
+
+
+def compute_orbit(max_t, mass_planet, mass_star, distance, eccentricity, cancelled=None, chunk=2**16):
+    """x, y, t and period of the exact orbit, or None when cancelled() turns True on the way.
+
+    The positions are computed in chunks of times, so a background
+    computation notices within one chunk that it is no longer needed.
+    """
     dt = 0.1
+    t = np.arange(int(np.floor(max_t / dt + 1e-9)) + 1) * dt
+    x = np.empty_like(t)
+    y = np.empty_like(t)
+    for start in range(0, len(t), chunk):
+        if cancelled is not None and cancelled():
+            return None
+        x[start:start + chunk], y[start:start + chunk] = kepler_positions(t[start:start + chunk], mass_star,
+                                                                         distance, eccentricity)
+    period = 2*np.pi*np.sqrt((distance / (1 + eccentricity))**3 / mass_star)
+    return x, y, t, period
+
+
+def euler_positions(max_t, mass_star, distance, eccentricity, dt=0.1):
+    """Integrate the orbit with explicit Euler steps, yields (x, y, t)"""
+    t = 0
 
     x = distance
     y = 0
@@ -96,6 +129,38 @@ def get_planet_positions(max_t, mass_planet, mass_star, distance, eccentricity):
         t += dt
 
 
+def solve_kepler(M, e, tol=1e-12, max_iter=50):
+    """Eccentric anomaly E with E - e sin(E) = M, for an array of mean anomalies M.
+
+    Newton's method on all anomalies at once, starting from Danby's guess
+    E = M + 0.85 e sign(sin M), which converges for every e < 1.
+    """
+    M = np.remainder(np.asarray(M, dtype="float64") + np.pi, 2*np.pi) - np.pi
+    E = M + 0.85 * e * np.sign(np.sin(M))
+    for _ in range(max_iter):
+        step = (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+        E -= step
+        if np.max(np.abs(step), initial=0) < tol:
+            break
+    return E
+
+
+def kepler_positions(t, mass_star, distance, eccentricity):
+    """Exact positions x, y at the times t of the orbit that get_planet_positions starts.
+
+    The planet starts at (distance, 0) with the speed that makes this point
+    the apoapsis, so the semi-major axis is distance / (1 + e) and the
+    periapsis lies on the negative x axis.
+    """
+    e = eccentricity
+    a = distance / (1 + e)
+    b = a * np.sqrt(1 - e**2)
+    n = np.sqrt(mass_star / a**3)  # Mean motion
+
+    E = solve_kepler(np.pi + n * np.asarray(t, dtype="float64"), e)
+    return -a * (np.cos(E) - e), -b * np.sin(E)
+
+
 
 if __name__ == "__main__":
     plot_planetary_orbits(20, 1.0, 1000, 10, 0)
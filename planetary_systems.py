@@ -3,49 +3,166 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Slider
 import itertools
+from ring_buffer import RingBuffer
+from frame_cache import FrameCache
 
 class PlanetarySystem:
-    def __init__(self, planets_data, star_mass=1000):
-        self.planets = [{'mass': m, 'distance': d} for m, d in planets_data]
+    def __init__(self, planets_data, star_mass=1000, history=50):
+        masses, distances = zip(*planets_data) if len(planets_data) else ((), ())
+        self.masses = np.array(masses, dtype="float64")
+        self.distances = np.array(distances, dtype="float64")
         self.n = len(planets_data)
+        self.revision = 0  # Counts the changes of the star mass, the time scale and the phases
         self.Ms = star_mass
         self.G = 1.0
         self.base_dt = 0.1
         self.time_scale = 1.0
         self.t = 0
         self.thetas = np.zeros(self.n)  # Initial angles
-        self.xs = []
-        self.ys = []
-
-    def orbit_generator(self):
-        # Yield list of [x, y] positions forever
+        self.trail = RingBuffer(history, (2, self.n))  # x and y of the last frames
+
+    @property
+    def Ms(self):
+        return self._Ms
+
+    @Ms.setter
+    def Ms(self, Ms):
+        self._Ms = Ms
+        self.revision += 1
+
+    @property
+    def time_scale(self):
+        return self._time_scale
+
+    @time_scale.setter
+    def time_scale(self, time_scale):
+        self._time_scale = time_scale
+        self.revision += 1
+
+    @property
+    def xs(self):
+        """x of every planet in the last frames, shape (frames, n)"""
+        return self.trail.view()[:, 0]
+
+    @property
+    def ys(self):
+        """y of every planet in the last frames, shape (frames, n)"""
+        return self.trail.view()[:, 1]
+
+    def orbit_generator(self, block=None):
+        """Yield the x and y positions forever, every frame as two arrays of shape (n,).
+
+        With block=K every yield holds K consecutive frames at once, as two
+        arrays of shape (K, n) computed in one vectorized pass; self.t is the
+        time of the first frame and the frames are base_dt * time_scale apart.
+        """
+        k = 1 if block is None else block
+        if k < 1:
+            raise ValueError(f"block should be >= 1, {block} was given")
+        steps = np.arange(k)[:, np.newaxis]
         while True:
-            x, y = np.array([(p["distance"] * np.cos(t), p["distance"] * np.sin(t)) for p, t in zip(self.planets, self.thetas)]).T
-            if len(self.xs) == 50:
-                self.xs.pop(0)
-                self.ys.pop(0)
-                
-            self.xs.append(x)
-            self.ys.append(y)
-
-            yield x, y
             dt = self.base_dt * self.time_scale
-            distance = np.array([p['distance'] for p in self.planets])
-
-            self.thetas += np.sqrt(self.G * self.Ms) * distance**-1.5 * dt
+            omega = np.sqrt(self.G * self.Ms) * self.distances**-1.5
+            thetas = self.thetas + steps * (omega * dt)
+            x = self.distances * np.cos(thetas)
+            y = self.distances * np.sin(thetas)
+            self.trail.extend(np.stack([x, y], axis=1))
+
+            yield (x[0], y[0]) if block is None else (x, y)
+
+            # The step after the block takes the star mass and time scale of now, and
+            # starts from self.thetas, so that a reset() or seek() in between is kept
+            dt_next = self.base_dt * self.time_scale
+            omega_next = np.sqrt(self.G * self.Ms) * self.distances**-1.5
+            self.thetas = self.thetas + (k - 1) * omega * dt + omega_next * dt_next
+            self.t += (k - 1) * dt + dt_next
+
+    def frame_generator(self, cache, length=64):
+        """Yield the x and y positions frame by frame, like orbit_generator, from cached blocks.
+
+        A block of `length` frames started at phase zero only depends on the
+        star mass, the time scale and the planets, so it is stored in the
+        FrameCache under their quantized values. A block at any other phase
+        is the cached one rotated by the phases at its start, in one
+        vectorized pass, and every frame is then a row of it. The quantized
+        star mass and time scale are used throughout; they are looked up
+        again only after a slider moved, and when they change a new block
+        starts at the next frame. So does a reset() or seek() in a block.
+        """
+        revision = self.revision
+        Ms, time_scale = cache.key(self.Ms, self.time_scale)
+        while True:
+            dt = self.base_dt * time_scale
+            key = (Ms, time_scale, self.G, self.base_dt, length, self.distances.tobytes())
+            x0, y0, turn = cache.get_or_compute(key, lambda: self._frame_block(length, Ms, dt))
+
+            start = self.thetas
+            c0, s0 = np.cos(start), np.sin(start)
+            xs = x0 * c0 - y0 * s0
+            ys = x0 * s0 + y0 * c0
+            for i in range(length):
+                self.trail.push((xs[i], ys[i]))
+
+                yield xs[i], ys[i]
+                if self.revision != revision:
+                    revision = self.revision
+                    if self.thetas is not start or cache.key(self.Ms, self.time_scale) != (Ms, time_scale):
+                        break
+                self.t += dt
+            else:
+                self.thetas = self.thetas + length * turn
+                continue
+
+            # The sliders moved or the phases were set: the step after this frame
+            # already takes the new values and starts from the phases of now
+            if self.thetas is start:
+                self.thetas = self.thetas + i * turn
+            Ms, time_scale = cache.key(self.Ms, self.time_scale)
+            dt = self.base_dt * time_scale
+            self.thetas = self.thetas + np.sqrt(self.G * Ms) * self.distances**-1.5 * dt
             self.t += dt
 
+    def _frame_block(self, length, Ms, dt):
+        # Frames 0 ... length - 1 of all planets started at phase zero, and the angle turned per frame
+        turn = np.sqrt(self.G * Ms) * self.distances**-1.5 * dt
+        angles = np.arange(length)[:, np.newaxis] * turn
+        return self.distances * np.cos(angles), self.distances * np.sin(angles), turn
+
+    def phases_at(self, t):
+        """Orbit angle of every planet at the times t, shape (*t.shape, n)"""
+        t = np.asarray(t, dtype="float64")[..., np.newaxis]
+        return np.sqrt(self.G * self.Ms) * self.distances**-1.5 * t
+
+    def positions_at(self, t):
+        """x and y of all planets at the times t in one vectorized call, both of shape (*t.shape, n).
+
+        The circular orbits are evaluated in closed form for the current star
+        mass, so any time can be reached directly without stepping.
+        """
+        phase = self.phases_at(t)
+        return self.distances * np.cos(phase), self.distances * np.sin(phase)
+
+    def seek(self, t):
+        """Jump to time t, orbit_generator continues from there"""
+        self.trail.clear()
+        self.thetas = self.phases_at(t)
+        self.t = t
+        self.revision += 1
+
     def reset(self):
-        self.xs = []
-        self.ys = []
+        self.trail.clear()
         self.thetas = np.zeros(self.n)
         self.t = 0
+        self.revision += 1
 
 
-def plot_planetary_system(max_t, planets_data):
+def plot_planetary_system(max_t, planets_data, cache=None):
     global planets
     system = PlanetarySystem(planets_data)
-    planets = system.orbit_generator()
+
+    # Frames come in blocks from the cache, which can be shared between dashboards
+    cache = FrameCache() if cache is None else cache
+    planets = system.frame_generator(cache)
     fig, ax = plt.subplots(figsize=(8,8))
     
     # Initialize star and planet scatters
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class RingBuffer():
+    """Fixed-capacity history of equally shaped arrays.
+
+    Pushing is O(1) and never allocates: every item is written twice, at
+    slot i and at slot i + capacity, so the stored items in chronological
+    order are always the contiguous slice data[head:head + size] and can be
+    handed out as a view without copying.
+    """
+    def __init__(self, capacity, shape=(), dtype="float64"):
+        if capacity < 1:
+            raise ValueError(f"capacity should be >= 1, {capacity} was given")
+        self.capacity = capacity
+        self.data = np.empty((2 * capacity, *shape), dtype=dtype)
+        self.head = 0
+        self.size = 0
+
+    def push(self, item):
+        """Append an item, dropping the oldest one when the buffer is full"""
+        tail = (self.head + self.size) % self.capacity
+        self.data[tail] = item
+        self.data[tail + self.capacity] = item
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.head = (self.head + 1) % self.capacity
+
+    def extend(self, items):
+        """Append several items at once, as if they were pushed one by one"""
+        items = items[len(items) - min(len(items), self.capacity):]
+        slots = (self.head + self.size + np.arange(len(items))) % self.capacity
+        self.data[slots] = items
+        self.data[slots + self.capacity] = items
+        dropped = max(0, self.size + len(items) - self.capacity)
+        self.size = min(self.capacity, self.size + len(items))
+        self.head = (self.head + dropped) % self.capacity
+
+    def view(self):
+        """Stored items from oldest to newest, shape (size, *shape), no copy"""
+        return self.data[self.head:self.head + self.size]
+
+    def last(self):
+        return self.data[(self.head + self.size - 1) % self.capacity]
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+
+class DecimatedHistory():
+    """Fixed-capacity history that thins out with age.
+
+    Level 0 keeps the last `capacity` items at full resolution, level l keeps
+    `capacity` items taken every factor**l pushes, so it reaches factor**l
+    times further back. view() stitches the levels together, every level
+    only contributing the items that are older than the next finer one.
+    Memory is (levels + 1) * capacity items and view() copies at most that
+    many, however long the history runs. With levels=0 it is a RingBuffer
+    and view() does not copy.
+    """
+    def __init__(self, capacity, shape=(), levels=0, factor=4, dtype="float64"):
+        if levels < 0:
+            raise ValueError(f"levels should be >= 0, {levels} was given")
+        if factor < 2:
+            raise ValueError(f"factor should be >= 2, {factor} was given")
+        self.factor = factor
+        self.buffers = [RingBuffer(capacity, shape, dtype) for _ in range(levels + 1)]
+        self.steps = [RingBuffer(capacity, dtype=np.int64) for _ in range(levels + 1)]
+        self.count = 0
+
+    def push(self, item):
+        for level, (buffer, steps) in enumerate(zip(self.buffers, self.steps)):
+            if self.count % self.factor**level:
+                break  # Coarser levels take a subset of the pushes of this one
+            buffer.push(item)
+            steps.push(self.count)
+        self.count += 1
+
+    def _parts(self):
+        # Per level, newest level first, the items older than those of the finer levels
+        parts = []
+        newer = self.count  # Oldest step of the finer levels, already covered
+        for buffer, steps in zip(self.buffers, self.steps):
+            parts.append(buffer.view()[:np.searchsorted(steps.view(), newer)])
+            if len(steps):
+                newer = min(newer, steps.view()[0])
+        return parts
+
+    def view(self):
+        """Stored items from oldest to newest, shape (size, *shape)"""
+        if len(self.buffers) == 1:
+            return self.buffers[0].view()
+        return np.concatenate(self._parts()[::-1])
+
+    def last(self):
+        return self.buffers[0].last()
+
+    def clear(self):
+        for buffer, steps in zip(self.buffers, self.steps):
+            buffer.clear()
+            steps.clear()
+        self.count = 0
+
+    def __len__(self):
+        return sum(len(part) for part in self._parts())
@@ -0,0 +1,75 @@
+import numpy as np
+
+# The own cell and the 13 neighbour cells that come after it, so every pair of cells is visited once
+HALF_SHELL = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+              if (dx, dy, dz) >= (0, 0, 0)]
+
+
+class SpatialHash():
+    """Uniform-grid neighbour index for finding all pairs closer than a radius.
+
+    Bodies are binned in cubic cells of size `cell_size` and kept sorted by
+    cell key, so the bodies of a cell are a contiguous range found with a
+    binary search. The sort order is kept between updates: when no body
+    changed cell nothing is sorted, otherwise the previous order is re-sorted,
+    which is cheap since it is nearly sorted already. Candidate pairs come
+    from the own cell and 13 neighbour cells only, so the cost is O(n log n)
+    plus the number of close pairs instead of O(n^2).
+    """
+    def __init__(self, cell_size):
+        if cell_size <= 0:
+            raise ValueError(f"cell_size should be strictly positive, {cell_size} was given")
+        self.cell_size = cell_size
+        self.order = None
+        self.resorts = 0
+
+    def _keys(self, cells):
+        # Exact mixed-radix key, the corner is shifted so neighbour cells never go negative
+        c = cells - self.corner
+        return (c[..., 0] * self.span[1] + c[..., 1]) * self.span[2] + c[..., 2]
+
+    def update(self, positions):
+        """Re-bin the bodies at their new positions"""
+        self.cells = np.floor(positions / self.cell_size).astype(np.int64)
+        self.corner = self.cells.min(axis=0) - 1
+        self.span = self.cells.max(axis=0) - self.corner + 2
+        if np.prod(self.span.astype("float64")) >= 2.0**62:
+            raise ValueError("cell_size is too small for the extent of the system")
+        keys = self._keys(self.cells)
+
+        if self.order is None or len(self.order) != len(keys):
+            self.order = np.argsort(keys, kind="stable")
+            self.resorts += 1
+        else:
+            keys_in_order = keys[self.order]
+            if np.any(keys_in_order[1:] < keys_in_order[:-1]):
+                self.order = self.order[np.argsort(keys_in_order, kind="stable")]
+                self.resorts += 1
+        self.sorted_keys = keys[self.order]
+
+    def pairs(self, positions, radius=None):
+        """All pairs (i, j) with i < j closer than radius (default cell_size), and their distances"""
+        radius = self.cell_size if radius is None else radius
+        if radius > self.cell_size:
+            raise ValueError(f"radius should be <= cell_size, {radius} was given")
+        self.update(positions)
+
+        n = len(positions)
+        sorted_cells = self.cells[self.order]
+        first, second = [], []
+        for offset in HALF_SHELL:
+            keys = self._keys(sorted_cells + offset)
+            lo = np.searchsorted(self.sorted_keys, keys, side="left")
+            hi = np.searchsorted(self.sorted_keys, keys, side="right")
+            if offset == (0, 0, 0):
+                lo = np.arange(1, n + 1)  # Same cell: only the bodies after this one
+            count = np.maximum(hi - lo, 0)
+            first.append(np.repeat(np.arange(n), count))
+            second.append(np.repeat(lo, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count))
+
+        i = self.order[np.concatenate(first)]
+        j = self.order[np.concatenate(second)]
+        distance = np.linalg.norm(positions[i] - positions[j], axis=1)
+        close = distance < radius
+        pairs = np.sort(np.stack([i[close], j[close]], axis=1), axis=1)
+        return pairs, distance[close]
@@ -5,8 +5,116 @@ from matplotlib.widgets import Slider
 
 
 
+class StringSolver():
+    """Finite-difference leapfrog solver of the damped wave equation u_tt = c^2 u_xx - 2 damping u_t.
+
+    The string lives on the uniform grid x and is advanced with a fixed
+    time step dt. Three preallocated buffers hold the previous, current and
+    next displacement and take turns, so a step only does in-place slicing
+    arithmetic and never allocates. Ends are fixed (u = 0) or free
+    (du/dx = 0, mirrored ghost nodes).
+    """
+    def __init__(self, x, dt, boundary="fixed", damping=0.0):
+        if boundary not in ("fixed", "free"):
+            raise ValueError(f"boundary should be 'fixed' or 'free', {boundary} was given")
+        if damping < 0:
+            raise ValueError(f"damping should be >= 0, {damping} was given")
+        self.x = np.asarray(x, dtype="float64")
+        self.dx = self.x[1] - self.x[0]
+        self.dt = dt
+        self.boundary = boundary
+        self.damping = damping
+        self.buffers = np.zeros((3, len(self.x)))
+        self.current = 0  # Index of the current displacement, previous is current - 1
+        self.velocity = np.zeros(len(self.x))  # Initial velocity, only used by the first step
+        self.steps = 0
+        self.time = 0
+
+    @property
+    def y(self):
+        """Current displacement, a view on one of the buffers"""
+        return self.buffers[self.current]
+
+    def set_shape(self, shape="pluck", amplitude=1.0, position=0.25, width=0.1, speed=1.0):
+        """Start at rest from a triangle peaking at `position` (pluck), or flat with a
+        raised-cosine velocity bump of `width` around it (strike). Position and
+        width are fractions of the string length. Either way the displacement
+        peaks at `amplitude`; for a strike that is the height of the two pulses
+        running away at wave speed `speed`."""
+        length = self.x[-1] - self.x[0]
+        s = (self.x - self.x[0]) / length
+        if shape == "pluck":
+            displacement = amplitude * np.minimum(s / position, (1 - s) / (1 - position))
+            velocity = np.zeros_like(s)
+        elif shape == "strike":
+            displacement = np.zeros_like(s)
+            bump = np.abs(s - position) < width / 2
+            # Each pulse carries half the momentum: height = integral of the velocity / (2 speed) = peak * width / (4 speed)
+            peak = 4 * speed * amplitude / (width * length)
+            velocity = np.where(bump, 0.5 * peak * (1 + np.cos(2 * np.pi * (s - position) / width)), 0.0)
+        else:
+            raise ValueError(f"shape should be 'pluck' or 'strike', {shape} was given")
+        self.buffers[...] = 0
+        self.current = 0
+        self.buffers[0] = displacement
+        self.velocity[...] = velocity
+        self.steps = 0
+        self.time = 0
+
+    def _laplacian(self, u, out):
+        # Second difference u[i+1] - 2 u[i] + u[i-1], in place
+        np.add(u[2:], u[:-2], out=out[1:-1])
+        out[1:-1] -= u[1:-1]
+        out[1:-1] -= u[1:-1]
+        if self.boundary == "free":
+            out[0] = 2 * (u[1] - u[0])
+            out[-1] = 2 * (u[-2] - u[-1])
+        else:
+            out[0] = out[-1] = 0
+        return out
+
+    def step(self, c):
+        """Advance by dt with wave speed c"""
+        r2 = (c * self.dt / self.dx)**2
+        if r2 > 1:
+            raise ValueError(f"c * dt / dx should be <= 1 for stability, {np.sqrt(r2):.3f} was given")
+        g = self.damping * self.dt
+        cur = self.buffers[self.current]
+        prev = self.buffers[(self.current - 1) % 3]
+        nxt = self.buffers[(self.current + 1) % 3]
+
+        if self.steps == 0:
+            # Start from the initial velocity: u(-dt) = u(dt) - 2 dt v, from a Taylor step
+            self._laplacian(cur, prev)
+            prev *= 0.5 * r2
+            prev += cur
+            prev -= (1 + g) * self.dt * self.velocity
+
+        # (1 + g) u_next = 2 u - (1 - g) u_prev + r2 laplacian(u)
+        self._laplacian(cur, nxt)
+        nxt *= r2
+        nxt += cur
+        nxt += cur
+        prev *= 1 - g
+        nxt -= prev
+        if g:
+            nxt /= 1 + g
+        if self.boundary == "fixed":
+            nxt[0] = nxt[-1] = 0
+
+        self.current = (self.current + 1) % 3
+        self.steps += 1
+        self.time += self.dt
+
+    def scale(self, factor):
+        """Scale the whole motion, e.g. when the amplitude changes"""
+        self.buffers *= factor
+        self.velocity *= factor
+
+
 class Wave():
-    def __init__(self, max_t, tension, density, amplitude):
+    def __init__(self, max_t, tension, density, amplitude, mode="analytic", boundary="fixed", shape="pluck",
+                 damping=0.0):
         if max_t <= 0:
             raise ValueError("max_t should be strictly positive")
         else:
@@ -27,11 +135,31 @@ class Wave():
         self.dt = 0.1
         self.x = np.arange(0, 20.1, 0.1)
         self.k = 2 * np.pi / 10
+
+        # mode "string" solves the wave equation on the string instead of
+        # evaluating a travelling sine; the solver step is stable up to the
+        # highest speed the allowed tension and density give
+        if mode not in ("analytic", "string"):
+            raise ValueError(f"mode should be 'analytic' or 'string', {mode} was given")
+        self.mode = mode
+        self.solver = None
+        if mode == "string":
+            max_speed = np.sqrt(150 / 0.1)
+            substeps = int(np.ceil(self.dt * max_speed / (0.9 * (self.x[1] - self.x[0]))))
+            self.solver = StringSolver(self.x, self.dt / substeps, boundary, damping)
+            self.solver.set_shape(shape, amplitude, speed=self.get_speed())
         self.update_wave()
 
 
     def update_wave(self):
         c = self.get_speed()
+        if self.solver is not None:
+            # Catch up with self.t, the displacement is a view on the solver buffers
+            for _ in range(int(round((self.t - self.solver.time) / self.solver.dt))):
+                self.solver.step(c)
+            self.y = self.solver.y
+            self.speed = c
+            return
         omega = self.k * c
         self.y = self.amplitude * np.sin(self.k * self.x - omega * self.t)
         self.speed = c
@@ -49,6 +177,8 @@ class Wave():
         self.density = density
 
     def set_amplitude(self, amplitude):
+        if self.solver is not None:
+            self.solver.scale(amplitude / self.amplitude)
         self.amplitude = amplitude
         
 
@@ -57,8 +187,8 @@ class Wave():
 
 
 
-def plot_wave_propagation(max_t, tension, density, amplitude):
-    wave = Wave(max_t, tension, density, amplitude)
+def plot_wave_propagation(max_t, tension, density, amplitude, **kwargs):
+    wave = Wave(max_t, tension, density, amplitude, **kwargs)
 
     # Get an inition plot
     fig, ax = plt.subplots()